@@ -0,0 +1,174 @@
+"""
+Step and ray tables for every piece label, square and side.
+
+The tables are built once at import time. Directions are written from the
+lower player's side of the board and negated for UPPER pieces. Every target
+is stored as (row, col, square) so Board can use it without converting.
+"""
+from bitboard import BitBoard, BOARD_SIZE, EMPTY, NUM_SQUARES, side_of, square, squares_of
+
+KING = [(1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (-1, 1), (1, -1), (-1, -1)]
+SHIELD = [(1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (-1, 1)]
+RELAY = [(0, 1), (1, -1), (1, 1), (-1, -1), (-1, 1)]
+PREVIEW = [(0, 1)]
+NOTES = [(1, 0), (-1, 0), (0, 1), (0, -1)]
+GOVERNANCE = [(1, 1), (-1, -1), (-1, 1), (1, -1)]
+
+# Directions a piece moves once in
+STEP_DIRECTIONS = {
+    'd': KING,
+    's': SHIELD,
+    'r': RELAY,
+    'p': PREVIEW,
+    '+r': SHIELD,
+    '+g': KING,
+    '+n': KING,
+    '+p': KING,
+}
+# Directions a piece moves continuously in
+RAY_DIRECTIONS = {
+    'n': NOTES,
+    'g': GOVERNANCE,
+    '+g': GOVERNANCE,
+    '+n': NOTES,
+}
+# Pieces that move continuously in a direction
+SLIDERS = frozenset(label for lower_label in RAY_DIRECTIONS for label in (lower_label, lower_label.upper()))
+
+# Inverses directions of moves for the UPPER player
+def mirror(directions):
+    return [(-dr, -dc) for (dr, dc) in directions]
+
+def _in_bounds(row, col):
+    return 0 <= row < BOARD_SIZE and 0 <= col < BOARD_SIZE
+
+def _steps(directions, row, col):
+    steps = []
+    for dr, dc in directions:
+        new_row, new_col = row + dr, col + dc
+        if _in_bounds(new_row, new_col):
+            steps.append(((new_row, new_col), square(new_row, new_col)))
+    return tuple(steps)
+
+def _rays(directions, row, col):
+    rays = []
+    for dr, dc in directions:
+        ray = []
+        new_row, new_col = row + dr, col + dc
+        while _in_bounds(new_row, new_col):
+            ray.append(((new_row, new_col), square(new_row, new_col)))
+            new_row += dr
+            new_col += dc
+        rays.append((dr, dc, tuple(ray)))
+    return tuple(rays)
+
+def _mask(targets):
+    mask = 0
+    for _, sq in targets:
+        mask |= 1 << sq
+    return mask
+
+def _build(directions_by_label, build):
+    table = {}
+    for lower_label, directions in directions_by_label.items():
+        for label, label_directions in ((lower_label, directions), (lower_label.upper(), mirror(directions))):
+            table[label] = tuple(build(label_directions, *divmod(sq, BOARD_SIZE)) for sq in range(NUM_SQUARES))
+    return table
+
+# STEPS: label -> square -> (((row, col), square), ...) a piece can step to
+# RAYS: label -> square -> ((dr, dc, (((row, col), square), ...)), ...) out to the board edge
+# STEP_MASKS: label -> square -> mask of STEPS
+STEPS = _build(STEP_DIRECTIONS, _steps)
+RAYS = _build(RAY_DIRECTIONS, _rays)
+STEP_MASKS = {label: tuple(_mask(steps) for steps in table) for label, table in STEPS.items()}
+NO_ATTACKS = (0,) * NUM_SQUARES
+NO_RAYS = ((),) * NUM_SQUARES
+
+# Squares a slider on sq reaches, stopping on the first piece in the way
+# A king never hides the square behind it, so that square counts as well
+def slider_attacks(squares, piece, sq):
+    mask = 0
+    for _, _, ray in RAYS[piece][sq]:
+        for i, (_, target) in enumerate(ray):
+            mask |= 1 << target
+            block = squares[target]
+            if block != EMPTY:
+                if block.lower() == 'd' and i + 1 < len(ray):
+                    mask |= 1 << ray[i + 1][1]
+                break
+    return mask
+# Squares a piece on sq attacks, the same squares Board.valid() returns when checking for check
+def piece_attacks(squares, piece, sq):
+    mask = STEP_MASKS.get(piece, NO_ATTACKS)[sq]
+    if piece in RAYS:
+        mask |= slider_attacks(squares, piece, sq)
+    return mask
+
+class AttackBoard(BitBoard):
+    """
+    BitBoard that also keeps, for every square, how many pieces of each side attack it
+    """
+    def __init__(self):
+        super().__init__()
+        self._init_attacks()
+    def _init_attacks(self):
+        # ATTACKS_FROM: Mask of squares attacked by the piece on every square
+        # ATTACK_COUNT: Number of lower and UPPER pieces attacking every square
+        # SLIDERS: Squares of pieces that move continuously in a direction
+        self.attacks_from = [0] * NUM_SQUARES
+        self.attack_count = [[0] * NUM_SQUARES, [0] * NUM_SQUARES]
+        self.sliders = 0
+    def clear(self):
+        super().clear()
+        self._init_attacks()
+    def put(self, sq, piece):
+        through = self._sliders_through(sq)
+        super().put(sq, piece)
+        if piece in SLIDERS:
+            self.sliders |= 1 << sq
+        self._set_attacks(sq, side_of(piece), piece_attacks(self.squares, piece, sq))
+        self._update_sliders(through)
+    def remove(self, sq):
+        piece = super().remove(sq)
+        if piece != EMPTY:
+            self.sliders &= ~(1 << sq)
+            self._set_attacks(sq, side_of(piece), 0)
+            self._update_sliders(self._sliders_through(sq))
+        return piece
+    # Squares of sliders whose attacks reach sq, these change when sq does
+    def _sliders_through(self, sq):
+        bit = 1 << sq
+        return [slider for slider in squares_of(self.sliders) if self.attacks_from[slider] & bit]
+    def _update_sliders(self, sliders):
+        for slider in sliders:
+            piece = self.squares[slider]
+            self._set_attacks(slider, side_of(piece), piece_attacks(self.squares, piece, slider))
+    # Replaces the attacks of the piece on sq and updates the counts of its side
+    def _set_attacks(self, sq, side, mask):
+        old = self.attacks_from[sq]
+        count = self.attack_count[side]
+        for target in squares_of(old & ~mask):
+            count[target] -= 1
+        for target in squares_of(mask & ~old):
+            count[target] += 1
+        self.attacks_from[sq] = mask
+    # Whether any piece of side attacks sq
+    def attacked(self, side, sq):
+        return self.attack_count[side][sq] != 0
+    # Squares of the pieces of side that attack sq, in square order
+    def attackers(self, side, sq):
+        bit = 1 << sq
+        return [attacker for attacker in squares_of(self.occupied[side]) if self.attacks_from[attacker] & bit]
+    # Empty squares between a slider on attacker and target, where a piece can block the attack
+    # Empty when the piece does not reach target along one of its rays
+    def block_squares(self, attacker, target):
+        piece = self.squares[attacker]
+        for _, _, ray in RAYS.get(piece, NO_RAYS)[attacker]:
+            between = []
+            for coord, sq in ray:
+                if sq == target:
+                    return between
+                if self.squares[sq] != EMPTY:
+                    break
+                between.append(coord)
+        return []
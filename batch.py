@@ -0,0 +1,100 @@
+"""
+Batch mode, plays many file mode test cases across a process pool.
+
+    python3 boxshogi.py -b <directory or glob> [-o <output directory> | -j <file.jsonl>] [-p <processes>]
+
+Every case is played in library mode (board.play_case), so a worker process
+plays thousands of games without restarting Python. With -o each game's output
+goes to <output directory>/<case name>.out, with -j every game is one JSON line
+in a single file, and without either the JSON lines go to standard output.
+A case that raised has its error in its JSON line, or in <case name>.err next
+to its output with -o, and on standard error. Throughput is reported on
+standard error and the exit status is 1 when any case raised, 2 when -o and
+-j are given together.
+"""
+import glob
+import io
+import json
+import multiprocessing
+import os
+import sys
+import time
+import board
+from outcome import render
+from utils import parseTestCase
+
+# Test case files from a directory, a glob or a single file
+def case_paths(source):
+    if os.path.isdir(source):
+        return sorted(glob.glob(os.path.join(source, '*.in')))
+    return sorted(glob.glob(source))
+# Plays one test case, returns (path, output, outcome, error)
+# Output is exactly what -f prints, up to the error if the case crashed
+def run_case(path):
+    out = io.StringIO()
+    try:
+        outcome = board.play_case(parseTestCase(path), out=out)
+    except Exception as error:
+        return path, out.getvalue(), None, '%s: %s' % (type(error).__name__, error)
+    out.write(render(outcome))
+    return path, out.getvalue(), outcome, None
+# JSON line for a played case
+def case_record(path, output, outcome, error):
+    record = {'case': path, 'output': output}
+    if outcome is not None:
+        record.update(winner=outcome.winner, reason=outcome.reason, turn=outcome.turn)
+    if error is not None:
+        record['error'] = error
+    return json.dumps(record)
+# Plays every case in paths on a pool of processes, results are written as they finish
+# Returns the number of games played, how many of them raised and the seconds it took
+def run_batch(paths, output_dir=None, jsonl=None, processes=None):
+    if output_dir and jsonl:
+        raise ValueError('Batch mode writes to an output directory or a JSON lines file, not both')
+    processes = processes or os.cpu_count() or 1
+    chunksize = max(1, min(64, len(paths) // (processes * 4)))
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    stream = open(jsonl, 'w') if jsonl else sys.stdout
+    start = time.perf_counter()
+    games, failed = 0, 0
+    try:
+        with multiprocessing.Pool(processes) as pool:
+            for path, output, outcome, error in pool.imap_unordered(run_case, paths, chunksize):
+                if output_dir:
+                    name = os.path.join(output_dir, os.path.splitext(os.path.basename(path))[0])
+                    with open(name + '.out', 'w') as f:
+                        f.write(output)
+                    if error is not None:
+                        with open(name + '.err', 'w') as f:
+                            f.write(error + '\n')
+                else:
+                    stream.write(case_record(path, output, outcome, error) + '\n')
+                if error is not None:
+                    print('%s: %s' % (path, error), file=sys.stderr)
+                    failed += 1
+                games += 1
+    finally:
+        if stream is not sys.stdout:
+            stream.close()
+    return games, failed, time.perf_counter() - start
+# Command line for batch mode, args are the arguments after -b
+def main(args):
+    paths = case_paths(args[0])
+    output_dir, jsonl, processes = None, None, None
+    for flag, value in zip(args[1::2], args[2::2]):
+        if flag == '-o':
+            output_dir = value
+        elif flag == '-j':
+            jsonl = value
+        elif flag == '-p':
+            processes = int(value)
+    if output_dir and jsonl:
+        print('usage: python3 boxshogi.py -b <directory or glob> [-o <output directory> | -j <file.jsonl>] [-p <processes>]', file=sys.stderr)
+        print('-o and -j cannot be given together', file=sys.stderr)
+        sys.exit(2)
+    games, failed, seconds = run_batch(paths, output_dir, jsonl, processes)
+    rate = games / seconds if seconds else 0.0
+    print('%d games in %.2f s (%.1f games/sec), %d raised' % (games, seconds, rate, failed), file=sys.stderr)
+    if failed:
+        sys.exit(1)
@@ -0,0 +1,134 @@
+"""
+Bitboard representation of the pieces on a BoxShogi board.
+
+Every square of the 5x5 board is one bit of a 25-bit integer. Squares are
+numbered file first, the same order Board.get_pieces() walks the board:
+a1 = 0, a2 = 1, ..., a5 = 4, b1 = 5, ..., e5 = 24.
+"""
+from zobrist import PIECE_KEYS
+
+# The BoxShogi board is 5x5
+BOARD_SIZE = 5
+NUM_SQUARES = BOARD_SIZE * BOARD_SIZE
+FULL = (1 << NUM_SQUARES) - 1
+
+# Label used by Board for an empty square
+EMPTY = '__'
+# Index of each player in per side lists
+LOWER = 0
+UPPER = 1
+# Unpromoted Previews of lower and UPPER, a file may hold only one of a player's for drops
+PREVIEWS = ('p', 'P')
+# FILE_MASKS: Squares of every file a to e
+# FILE_LOWS: First square of every file
+# ZONE_MASKS: Promotion zone of lower and UPPER, the last rank
+# PREVIEW_DROPS: Squares lower and UPPER may drop a Preview on before the file rule, outside their zone
+FILE_MASKS = tuple(((1 << BOARD_SIZE) - 1) << (row * BOARD_SIZE) for row in range(BOARD_SIZE))
+FILE_LOWS = sum(1 << (row * BOARD_SIZE) for row in range(BOARD_SIZE))
+ZONE_MASKS = (
+    sum(1 << (row * BOARD_SIZE + BOARD_SIZE - 1) for row in range(BOARD_SIZE)),
+    sum(1 << (row * BOARD_SIZE) for row in range(BOARD_SIZE)),
+)
+PREVIEW_DROPS = tuple(FULL & ~zone for zone in ZONE_MASKS)
+
+# Square index from board coordinates like 0, 0
+def square(row, col):
+    return row * BOARD_SIZE + col
+# Board coordinates like 0, 0 from a square index
+def coordinates(sq):
+    return divmod(sq, BOARD_SIZE)
+# Player index owning a piece label like 'p' or '+P'
+def side_of(piece):
+    return UPPER if piece.isupper() else LOWER
+# Mask of every file holding a square of mask
+# The five squares of a file are folded onto its first one, then spread over the file again
+def files_of(mask):
+    return ((mask | mask >> 1 | mask >> 2 | mask >> 3 | mask >> 4) & FILE_LOWS) * FILE_MASKS[0]
+# Yields the square index of every set bit, lowest first
+def squares_of(mask):
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+class BitBoard:
+    """
+    Class that stores one mask per piece label and one occupancy mask per side
+    """
+    def __init__(self):
+        # SQUARES: Piece label on every square, EMPTY when nothing is there
+        # MASKS: Piece label ('p', '+P', ...) to 25-bit mask of its squares
+        # OCCUPIED: Squares of every lower piece and every UPPER piece
+        # KEY: Zobrist key of the pieces on their squares, see zobrist.py
+        # PREVIEW_FILES: Files holding an unpromoted Preview of lower and UPPER, kept by put and remove
+        self.squares = [EMPTY] * NUM_SQUARES
+        self.masks = {}
+        self.occupied = [0, 0]
+        self.key = 0
+        self.preview_files = [0, 0]
+    # Mask of every occupied square
+    def occupancy(self):
+        return self.occupied[LOWER] | self.occupied[UPPER]
+    # Retrieves piece label on a square
+    def piece_at(self, sq):
+        return self.squares[sq]
+    # Places a piece on an empty square
+    def put(self, sq, piece):
+        bit = 1 << sq
+        self.squares[sq] = piece
+        self.masks[piece] = self.masks.get(piece, 0) | bit
+        self.occupied[side_of(piece)] |= bit
+        self.key ^= PIECE_KEYS[piece][sq]
+        if piece in PREVIEWS:
+            self.preview_files[side_of(piece)] |= FILE_MASKS[sq // BOARD_SIZE]
+    # Removes and returns the piece on a square, EMPTY if there was none
+    def remove(self, sq):
+        piece = self.squares[sq]
+        if piece != EMPTY:
+            bit = 1 << sq
+            self.squares[sq] = EMPTY
+            self.masks[piece] ^= bit
+            self.occupied[side_of(piece)] ^= bit
+            self.key ^= PIECE_KEYS[piece][sq]
+            if piece in PREVIEWS:
+                self.preview_files[side_of(piece)] = files_of(self.masks[piece])
+        return piece
+    # Replaces whatever is on a square, returns the piece that was there
+    def replace(self, sq, piece):
+        old = self.remove(sq)
+        if piece != EMPTY:
+            self.put(sq, piece)
+        return old
+    # Removes every piece
+    def clear(self):
+        self.squares = [EMPTY] * NUM_SQUARES
+        self.masks = {}
+        self.occupied = [0, 0]
+        self.key = 0
+        self.preview_files = [0, 0]
+    # Retrieves (row, col, piece) for all pieces, in square order
+    def pieces(self):
+        squares = self.squares
+        return [divmod(sq, BOARD_SIZE) + (squares[sq],) for sq in squares_of(self.occupancy())]
+    # Squares side may drop piece on: empty squares, for a Preview outside its zone and off files holding one
+    def drop_mask(self, side, piece):
+        mask = ~(self.occupied[LOWER] | self.occupied[UPPER]) & FULL
+        if piece in PREVIEWS:
+            mask &= PREVIEW_DROPS[side] & ~self.preview_files[side]
+        return mask
+    # Square of the first piece with this label, None if it is not on the board
+    def find(self, piece):
+        mask = self.masks.get(piece, 0)
+        if mask:
+            return (mask & -mask).bit_length() - 1
+        return None
+    # Loads pieces from a list of lists board like Board._board
+    def load(self, rows):
+        self.clear()
+        for row in range(BOARD_SIZE):
+            for col in range(BOARD_SIZE):
+                if rows[row][col] != EMPTY:
+                    self.put(square(row, col), rows[row][col])
+    # List of lists board like Board._board
+    def rows(self):
+        return [self.squares[row * BOARD_SIZE:(row + 1) * BOARD_SIZE] for row in range(BOARD_SIZE)]
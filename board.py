@@ -1,6 +1,21 @@
+import io
 import os
-import sys
-import copy
+from collections import namedtuple
+from bitboard import EMPTY, LOWER, UPPER, ZONE_MASKS, coordinates, side_of, square
+from attacks import AttackBoard, RAYS, STEPS, STEP_MASKS, slider_attacks
+from zobrist import SIDE_KEY, hand_key, hand_step
+from hand import Hand
+from outcome import CHECK, CHECKMATE, ILLEGAL_MOVE, MAX_PLIES, REPETITION, TOO_MANY_MOVES, GameOver, Outcome
+from history import History
+from utils import TestCaseError, parseTestCase
+
+# Everything make_move changed, enough for unmake_move to put the board back
+# START, END: Bitboard squares of the move, START is None for a drop
+# MOVED: Piece that left START, or the hand letter for a drop
+# PIECE: Piece placed on END, the promoted label when PROMOTED
+# CAPTURED: Piece that was on END, EMPTY if there was none
+# HAND, HAND_INDEX: Capture hand the move added to or the drop took from, and the serial of the piece in it
+MoveRecord = namedtuple('MoveRecord', ['start', 'end', 'moved', 'piece', 'captured', 'promoted', 'hand', 'hand_index'])
 
 class Board:
     """
@@ -16,24 +31,35 @@ class Board:
     # PIECETYPE: 'move' piece getting moved in proper cap (move, a1, a2) piece from a1 on the board
     # POSITION: 'drop' end location and 'move' end location of piece respectively
     # INTEARACTIVE: -f or -i
-    def __init__(self, move, move_state, initial_state, upper_cap, lower_cap, illegal_tuple, turn, last_move, piece_type, position, interactive=None):
+    # OUT: File output is written to, standard output when None
+    # PLAYERS: Player name 'lower' or 'UPPER' to an engine.Engine that moves for them in -i
+    # REPETITIONS: Times a position may occur before the game ends in a tie, None for no repetition rule
+    def __init__(self, move, move_state, initial_state, upper_cap, lower_cap, illegal_tuple, turn, last_move, piece_type, position, interactive=None, out=None, players=None, repetitions=None):
+        # BITBOARD: Piece masks and attack maps backing the board, _board is a list of lists view of it
+        self.bitboard = AttackBoard()
         self._board = self._initEmptyBoard()
         self.move = move
         self.move_state = move_state
         self.initial_state = initial_state
-        self.upper_cap = upper_cap
-        self.lower_cap = lower_cap
+        # UPPER_CAP, LOWER_CAP: Capture hands, see hand.Hand
+        self.upper_cap = Hand(upper_cap)
+        self.lower_cap = Hand(lower_cap)
+        # HANDS_KEY: Zobrist key of both capture hands, kept up to date by the hand helpers below
+        self.hands_key = hand_key(UPPER, upper_cap) ^ hand_key(LOWER, lower_cap)
         self.illegal_tuple = illegal_tuple
         self.turn = turn
         self.last_move = last_move
         self.piece_type = piece_type
         self.position = position
         self.interactive = interactive
+        self.out = out
+        self.players = players or {}
+        self.repetitions = repetitions
+        # HISTORY: Keys of the positions of the game, pushed by make_move and popped by unmake_move
+        self.history = History()
 
         # ALLPIECES: Pieces on the board in [(0, 0, 'd')] format
-        # DIRECTIONS: Directions the piece in play can move
         self.all_pieces = self.get_pieces()
-        self.directions = None
 
         # KING: King in check danger, uppercase or lowercase d
         # KINGCOORD: King coordinates in (0, 0) form
@@ -46,6 +72,13 @@ class Board:
     def _initEmptyBoard(self):
         empty_board = [['__' for _ in range(self.BOARD_SIZE)] for _ in range(self.BOARD_SIZE)]
         return empty_board
+    # List of lists view of the bitboard, assigning one loads it into the bitboard
+    @property
+    def _board(self):
+        return self.bitboard.rows()
+    @_board.setter
+    def _board(self, rows):
+        self.bitboard.load(rows)
     def __repr__(self):
         return self._stringifyBoard()
     def _stringifyBoard(self):
@@ -53,11 +86,12 @@ class Board:
         Utility function for printing the board
         """
         s = ''
-        for row in range(len(self._board) - 1, -1, -1):
+        squares = self.bitboard.squares
+        for row in range(self.BOARD_SIZE - 1, -1, -1):
 
             s += '' + str(row + 1) + ' |'
-            for col in range(0, len(self._board[row])):
-                s += self._stringifySquare(self._board[col][row])
+            for col in range(0, self.BOARD_SIZE):
+                s += self._stringifySquare(squares[square(col, row)])
 
             s += os.linesep
 
@@ -77,6 +111,12 @@ class Board:
             return ' ' + sq + '|'
         if len(sq) == 2:
             return sq + '|'
+    # Writes output like print, to out when the board was given one
+    def write(self, *args):
+        print(*args, file=self.out)
+    # Result of the game at this point, see outcome.Outcome
+    def game_outcome(self, winner=None, reason=None, in_check=None, next_player=None, escape_moves=()):
+        return Outcome(winner, reason, in_check, next_player, list(escape_moves), self._board, list(self.upper_cap), list(self.lower_cap), self.turn)
     # Input position a1 to return board row and column 0, 0
     def board_coordinates(self, position):
         row = ord(position[0]) - ord('a')
@@ -87,14 +127,18 @@ class Board:
         row_letter = chr(ord('a') + row)
         col_number = col+ 1
         return row_letter + str(col_number)
+    # Input coordinate 0, 0 to return its bitboard square, off board coordinates wrap like list indexes
+    def board_index(self, row, col):
+        board_range = range(self.BOARD_SIZE)
+        return square(board_range[row], board_range[col])
     # Iniital console output asking player for move in interactive mode
     def start_output_interactive(self):
         self.initial_state = self.init_interactive_pieces()
         self.init_board()
-        print(self.__str__())
+        self.write(self.__str__())
         self.report_end_capture()
-        print()
-        move = input('lower>')
+        self.write()
+        move = self.read_move('lower')
         return move
     # Initialize board for file mode by placing pieces on board
     def init_board(self):
@@ -102,7 +146,8 @@ class Board:
             p_piece = piece_info['piece']
             p_position = piece_info['position']
             row, col, = self.board_coordinates(p_position)
-            self._board[row][col] = p_piece
+            self.bitboard.replace(self.board_index(row, col), p_piece)
+        self.history.reset(self.position_key())
     # Dynamically gets pieces [{'piece': 'S', 'position': 'd5'}]
     def init_interactive_pieces(self):
         i_pieces = []
@@ -125,23 +170,66 @@ class Board:
     # Retrieves piece from a coordinate of the board
     def get_piece(self, start_position):
         row, col, = self.board_coordinates(start_position)
-        piece = self._board[row][col]
+        piece = self.bitboard.piece_at(self.board_index(row, col))
         return piece
     # Removes piece from letter representation like a1 on the board
     def remove_piece(self, start_position):
         row, col, = self.board_coordinates(start_position)
-        self._board[row][col] = '__'
-    # Adds piece from coordinates like 0, 0
-    def add_piece(self):
-        end_row, end_col, = self.board_coordinates(self.position)
-        potential_piece = self._board[end_row][end_col]
-        if potential_piece == '__':
-            self._board[end_row][end_col] = self.piece_type
-            return 1
-        elif potential_piece.isupper() != self.piece_type.isupper():
-            self._board[end_row][end_col] = self.piece_type
-            return potential_piece.replace('+', '')
-        return 1
+        self.bitboard.remove(self.board_index(row, col))
+    # Moves piece from start to end square, or drops it on end when start is None
+    # Piece is the label placed on end, so a promoted label promotes the moving piece
+    # A captured piece goes to the capture hand, the turn passes to the other player
+    def make_move(self, start, end, piece):
+        if start is None:
+            moved = piece
+            hand, hand_index = self.check_piece_present(piece)
+            piece = piece.replace('+', '')
+            captured = self.bitboard.replace(end, piece)
+        else:
+            moved = self.bitboard.remove(start)
+            captured = self.bitboard.replace(end, piece)
+            hand, hand_index = None, None
+            if captured != EMPTY and captured.isupper() != piece.isupper():
+                hand, hand_index = self.drop_remove_cap(captured.replace('+', ''))
+        self.turn += 1
+        self.history.push(self.position_key())
+        return MoveRecord(start, end, moved, piece, captured, start is not None and moved != piece, hand, hand_index)
+    # Puts the board, capture hands and turn back to before make_move returned record
+    def unmake_move(self, record):
+        self.history.pop()
+        self.turn -= 1
+        self.bitboard.replace(record.end, record.captured)
+        if record.start is None:
+            self.hand_add(record.hand, record.moved, record.hand_index)
+        else:
+            self.bitboard.put(record.start, record.moved)
+            if record.hand is not None:
+                self.hand_remove(record.hand, record.captured.replace('+', '').swapcase(), record.hand_index)
+    # Zobrist key of the position: pieces on their squares, capture hand counts and player to move
+    def position_key(self):
+        key = self.bitboard.key ^ self.hands_key
+        if self.turn % 2 == 1:
+            key ^= SIDE_KEY
+        return key
+    # Whether the position now has occurred at least times times in the game, this time included
+    def position_occurred(self, times):
+        return self.history.occurred(self.position_key(), times)
+    # Replaces the contents of both capture hands, the hands stay the same objects
+    def set_hands(self, upper_cap, lower_cap):
+        self.upper_cap.replace(upper_cap)
+        self.lower_cap.replace(lower_cap)
+        self.hands_key = hand_key(UPPER, self.upper_cap) ^ hand_key(LOWER, self.lower_cap)
+    # Adds piece to a capture hand, returns its serial, see Hand.add, and updates the hands key
+    def hand_add(self, hand, piece, serial=None):
+        side = UPPER if hand is self.upper_cap else LOWER
+        self.hands_key ^= hand_step(side, piece, hand.count(piece))
+        return hand.add(piece, serial)
+    # Removes piece from a capture hand, returns its serial, see Hand.remove, and updates the hands key
+    def hand_remove(self, hand, piece, serial=None):
+        side = UPPER if hand is self.upper_cap else LOWER
+        serial = hand.remove(piece, serial)
+        self.hands_key ^= hand_step(side, piece, hand.count(piece))
+        return serial
     # Helper to piece promote, validates if piece in promotion zone case sensitive
     def promotion_zone(self, piece, coord):
         _, col = self.board_coordinates(coord)
@@ -166,135 +254,57 @@ class Board:
     # Determines player turn, based on how many turns have been played
     def determine_turn(self, start_piece):
         self.piece_type = start_piece.upper()if self.turn % 2 == 1 else start_piece.lower()
-    # Moves for each piece
-    def get_piece_moves(self, lower_label):
-        # Static to piece
-        dir = []
-        if lower_label == 'd':
-            dir.append([(1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (-1, 1), (1, -1), (-1, -1)])
-        elif lower_label == 's':
-            dir.append([(1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (-1, 1)])
-        elif lower_label == 'r':
-            dir.append([(0, 1), (1, -1), (1, 1), (-1, -1), (-1, 1)])
-        elif lower_label == 'p':
-            dir.append([(0, 1)])
-        # Dynamic across board
-        if lower_label == 'n':
-            dir.append([(1, 0), (-1, 0), (0, 1), (0, -1)])
-        elif lower_label == 'g':
-            dir.append([(1, 1), (-1, -1), (-1, 1), (1, -1)])
-        # For promoted, taken from the above
-        if lower_label == '+r':
-            # Shield, static
-            dir.append([(1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (-1, 1)])
-        elif lower_label == '+g':
-            # Governance (dynamic) + Drive (static)
-            dir.append([(1, 1), (-1, -1), (-1, 1), (1, -1)])
-            dir.append([(1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (-1, 1), (1, -1), (-1, -1)])
-        elif lower_label == '+n':
-            # Notes (dynamic) + Drive (static)
-            dir.append([(1, 0), (-1, 0), (0, 1), (0, -1)])
-            dir.append([(1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (-1, 1), (1, -1), (-1, -1)])
-        elif lower_label == '+p':
-            # Shield (static)
-            dir.append([(1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (-1, 1), (1, -1), (-1, -1)])
-        return dir
-    # Inverses directions of moves depending on lower to UPPER as needed
-    def mirror_directions(self):
-        mirrored_directions = []
-        for sublist in self.directions:
-            mirrored_sublist = [(-dr, -dc) for (dr, dc) in sublist]
-            mirrored_directions.append(mirrored_sublist)
-        return mirrored_directions
     # Returns moves that can be made for pieces that can move continuously in a direction
-    def valid_dynamic_helper(self, start_row, start_col, cur_piece, index, is_check):
+    # Rays come from the precomputed attacks.RAYS table for the piece and its square
+    def valid_dynamic_helper(self, rays, is_check):
         valid_moves = []
-        for r, c in self.directions[index]:
-            new_row, new_col = start_row + r, start_col + c
-            while 0 <= new_row < self.BOARD_SIZE and 0 <= new_col < self.BOARD_SIZE:
-                block_found = False
-                for block in self.all_pieces:
-                    # CASE: Piece can capture opposite team, not own
-                    # CASE: Check, king can capture opposite team, not own
-                    if not is_check:
-                        if block[2].isupper() != cur_piece.isupper():
-                            valid_moves.append((new_row, new_col))
-                            break
-                    elif is_check:
-                        if (block[0], block[1]) == (new_row, new_col):
-                            # CASE: Check, opponent piece can move one space past king
-                            if block[2].lower() == 'd':
-                                valid_moves.append((new_row+r, new_col+c))
-                            valid_moves.append((new_row, new_col))
-                            block_found = True
-                            break  
-                if block_found:
+        squares = self.bitboard.squares
+        for r, c, ray in rays:
+            for new_coord, new_square in ray:
+                valid_moves.append(new_coord)
+                block = squares[new_square]
+                # CASE: Check, piece stops on the first piece in its way
+                if is_check and block != EMPTY:
+                    # CASE: Check, opponent piece can move one space past king
+                    if block.lower() == 'd':
+                        valid_moves.append((new_coord[0]+r, new_coord[1]+c))
                     break
-                valid_moves.append((new_row, new_col))
-                new_row += r
-                new_col += c
         return valid_moves
     # Returns moves that can be made for pieces that can only move once into a direction
-    def valid_static_helper(self, start_row, start_col, cur_piece, index, is_check):
+    # Steps come from the precomputed attacks.STEPS table for the piece and its square
+    def valid_static_helper(self, steps, cur_piece, is_check):
         valid_moves = []
-        for r, c in self.directions[index]:
-            new_row, new_col = start_row + r, start_col + c
-            if 0 <= new_row < 5 and 0 <= new_col < 5:
-                for block in self.all_pieces:
-                    block_found = False
-                    for block in self.all_pieces:
-                        if block[0] == new_row and block[1] == new_col:
-                            block_found = True
-                            if not is_check:
-                                if block[2].isupper() != cur_piece.isupper():
-                                    valid_moves.append((new_row, new_col))
-                                    break
-                            elif is_check:
-                                if (block[0], block[1]) == (new_row, new_col):
-                                    valid_moves.append((new_row, new_col))
-                                    block_found = True
-                                    break
-                    if block_found:
-                        break
-                    valid_moves.append((new_row, new_col))
+        squares = self.bitboard.squares
+        for new_coord, new_square in steps:
+            block = squares[new_square]
+            # CASE: Piece can capture opposite team, not own
+            # CASE: Check, every square the piece reaches counts
+            if is_check or block == EMPTY or block.isupper() != cur_piece.isupper():
+                valid_moves.append(new_coord)
         return valid_moves
     # Takes in pieces identity and start position to return valid moves
     def valid(self, cur_piece, start_position, is_check):
-        lower_label = cur_piece.lower()
         start_row, start_col, = self.board_coordinates(start_position)
-        self.directions = self.get_piece_moves(lower_label)
-        if cur_piece.isupper():
-            self.directions = self.mirror_directions()
+        start_square = self.board_index(start_row, start_col)
         val_moves = []
         # Dynamic
-        if lower_label in ['n', 'g']:
-            val_moves.append(list(set(self.valid_dynamic_helper(start_row, start_col, cur_piece, 0, is_check))))
-        # Static
-        elif lower_label in ['d', 's', 'r', 'p', '+r', '+p']:
-            val_moves.append(list(set(self.valid_static_helper(start_row, start_col, cur_piece, 0, is_check))))
-        # Dyanimic then Static
-        elif lower_label in ['+n', "+g"]:
-            val_moves.append(list(set(self.valid_dynamic_helper(start_row, start_col, cur_piece, 0, is_check))))
-            val_moves.append(list(set(self.valid_static_helper(start_row, start_col, cur_piece, 1, is_check))))
-        val_moves = [move for sublist in val_moves for move in sublist]
+        if cur_piece in RAYS:
+            val_moves.extend(set(self.valid_dynamic_helper(RAYS[cur_piece][start_square], is_check)))
+        # Static, after Dynamic for promoted Notes and Governance
+        if cur_piece in STEPS:
+            val_moves.extend(set(self.valid_static_helper(STEPS[cur_piece][start_square], cur_piece, is_check)))
         return val_moves
     # BASE: Base case of what gets updated upon a succesful drop turn
     def drop_move_base(self, row, col):
-        self.check_piece_present()
-        self._board[row][col] = self.piece_type.replace('+', '')
+        record = self.make_move(None, self.board_index(row, col), self.piece_type)
         self.last_move = [self.piece_type.isupper(), self.move]
-        return
+        return record
     # Removes trailing spaces for captured pieces array (for autograder)
     def capture_string(self, capture_arr):
         return ' '.join(capture_arr)
     # Retrieves (row, col, piece) for all pieces
     def get_pieces(self):
-        pieces = []
-        for row in range(len(self._board)):
-            for col in range(len(self._board[0])):
-                if self._board[row][col] != '__':
-                    pieces.append((row, col, self._board[row][col]))
-        return pieces
+        return self.bitboard.pieces()
     # Based on moves played, determines who's turn it is and whose king is in check
     def determine_king(self):
         return 'D' if self.turn % 2 == 1 else 'd'
@@ -307,57 +317,26 @@ class Board:
     def move_information(self, move_info):
         start, self.position = move_info[1], move_info[2]
         end_row, end_col = self.board_coordinates(self.position)
-        tmp_board = copy.deepcopy(self._board)
         move_info_len = len(move_info)
         start_move = self.get_piece(start)
         self.piece_type = start_move
         tmp_start_piece = self.piece_type
         valid_moves = self.valid(self.piece_type, start, True)
-        return start, end_row, end_col, tmp_board, move_info_len, tmp_start_piece, valid_moves
+        return start, end_row, end_col, move_info_len, tmp_start_piece, valid_moves
     def drop_information(self, move_info):
         piece_type, self.position = move_info[1], move_info[2]
         row, col = self.board_coordinates(move_info[2])
-        cur_piece = self._board[row][col]
-        tmp_board = copy.deepcopy(self._board)
-        tmp_lower_cap = copy.deepcopy(self.lower_cap)
-        tmp_upper_cap = copy.deepcopy(self.upper_cap)
+        cur_piece = self.bitboard.piece_at(self.board_index(row, col))
         # This makes the piece uppercase or lowercase according to who's turn it is
         self.determine_turn(piece_type)
-        return row, col, cur_piece, tmp_board, tmp_lower_cap, tmp_upper_cap
-    # Helper to retrieve moves on the same team as opp_case, which is a leter from the same team
-    # Opponent_moves stores (row, column, a1) and opponent_moves_dic stores {a1: [[0, 0]]}
-    # Opponent_moves stores information of piece, opponent_moves_dic stores moves
-    # No flat allows me to isolate moves made in a certain direction by a piece for manymoves
-    def opponent_moves(self, opp_case, no_flat = None):
-        opponent_pieces = []
-        opponent_move_dic = {}
-        for piece_info in self.all_pieces:
-            if (piece_info[2]).isupper() == (opp_case).isupper():
-                opponent_pieces.append(piece_info)
-        opponent_moves = []
-        for piece in opponent_pieces:
-            piece_type = piece[2]
-            if piece_type.isupper() == opp_case.isupper():
-                piece_letter = self.coordinates_to_letter(piece[0], piece[1])
-                piece_moves = self.valid(piece_type, piece_letter, True) if not no_flat else self.valid_block(piece_type, piece_letter, True)
-                opponent_moves.append(piece_moves)
-                opponent_move_dic[piece_letter] = piece_moves
-        return opponent_moves, opponent_move_dic
-    # Returns the number of moves that the opponent_moves has the king in check
-    def count_check(self, opponent_moves):
-        check = 0
-        for opponent_piece in opponent_moves:
-            for move in opponent_piece:
-                if self.king_coord == move:
-                    check += 1
-        return check
+        return row, col, cur_piece
     # Returns the moves a king could make that would result in a loss
-    def check_move(self, king_moves, opponent_moves_flat):
+    # Looked up on the attack maps of opp_side instead of generating the opponent moves
+    def check_move(self, king_moves, opp_side):
         check_move = []
         for king_move in king_moves:
-            for move in opponent_moves_flat:
-                if king_move == (move[0], move[1]):
-                    check_move.append(king_move)
+            if self.bitboard.attacked(opp_side, square(king_move[0], king_move[1])):
+                check_move.append(king_move)
         return check_move
     # King information that may be of use when verifying a check
     def king_information(self):
@@ -367,70 +346,56 @@ class Board:
         self.king_letter = self.coordinates_to_letter(king_info[0], king_info[1])
         king_moves = self.valid(king_info[2], self.king_letter, False)
         return king_info, king_moves
-    # Returns the pieces and its move from the opponent player that have the players' king in check
-    def opp_info(self, opponent_move_dic):
-        opp_info = {}
-        for key, value in opponent_move_dic.items():
-            if self.king_coord in value:
-                for move in self.all_pieces:
-                    if self.coordinates_to_letter(move[0], move[1]) == key:
-                        opp_info[key] = value
-                        opp_info[key].append((move[0], move[1]))
-        return opp_info
     # Returns the opponent moves that are in the direction from a piece to the king
     # For example, if a piece moves horizontally it identifies which horizontal direction
-    def opponent_moves_to_king(self, opponent_move_dic_no_flat, king_info):
+    def opponent_moves_to_king(self, opp_square, king_square):
         # First identifying the moves
-        opponent_moves_to_king = []
-        for _, opp_value in opponent_move_dic_no_flat.items():
-            for opp_arr in opp_value:
-                for opp_moves in opp_arr:
-                    king_row, king_col = king_info[0], king_info[1]
-                    for move_row, move_col in opp_moves:
-                        if (move_row, move_col) == (king_row, king_col):
-                            opponent_moves_to_king.append(opp_moves)
-                            break
-                    else:
-                        continue
-                    break
+        opponent_moves_to_king = self.bitboard.block_squares(opp_square, king_square)
         # Filtering the moves that are out of bounds
         update_to_king = []
-        for direction in opponent_moves_to_king:
-            for move in direction:
-                if move[0] >= 0 and move[1] < self.BOARD_SIZE-1 and move != (king_info[0], king_info[1]):
-                    update_to_king.append(move)
+        for move in opponent_moves_to_king:
+            if move[0] >= 0 and move[1] < self.BOARD_SIZE-1:
+                update_to_king.append(move)
         return update_to_king
     # Returns moves a player can play to drop a piece to not lose
     def check_drop_moves(self, update_to_king):
         hand = self.upper_cap if self.king.isupper() else self.lower_cap
+        if not hand or not update_to_king or not self.piece_type:
+            return []
+        # CHECK valid drop, the same for every square and piece
+        if (self.piece_type.lower() == 'p' and self.preview_drop()) or (self.piece_type.lower() == 'p' and self.preview_double()):
+            return []
+        drop_letters = [self.coordinates_to_letter(move[0], move[1]) for move in update_to_king]
         drop_moves = []
-        for piece in hand:
-            for move in update_to_king:
-                if self.piece_type:
-                    # CHECK valid drop
-                    if (self.piece_type.lower() == 'p' and self.preview_drop()) or (self.piece_type.lower() == 'p' and self.preview_double()):
-                        continue
-                    tmp_letter = self.coordinates_to_letter(move[0], move[1])
-                    drop_moves.append((piece.lower(), tmp_letter))
+        # Every copy of a piece in hand lists its drops, like the file mode output always has
+        for piece, count in hand.items():
+            for tmp_letter in drop_letters:
+                drop_moves.extend([(piece.lower(), tmp_letter)] * count)
         return drop_moves
     # Updates moves to king to include opponent piece puttin king in check
     # Updated in consideration that youo can't drop a piece onto another piece
-    def update_to_king(self, opp_info, update_to_king):
-        for key, _ in opp_info.items():
-            key_r, key_c = self.board_coordinates(key)
-            update_to_king.append((key_r, key_c))
+    def update_to_king(self, opp_squares, update_to_king):
+        for opp_square in opp_squares:
+            update_to_king.append(coordinates(opp_square))
         return update_to_king
     # Returns moves of pieces other than the king to block the check
-    def alternative_moves(self, player_move_dic, update_to_king):
+    # Player pieces reaching each square are looked up on the attack maps
+    def alternative_moves(self, update_to_king):
         alternative_moves = []
-        for key, value in player_move_dic.items():
-            for move in update_to_king:
+        squares = self.bitboard.squares
+        player_side = side_of(self.king)
+        for move in update_to_king:
+            move_square = square(move[0], move[1])
+            end_letter = self.coordinates_to_letter(move[0], move[1])
+            for player_square in self.bitboard.attackers(player_side, move_square):
+                key = self.coordinates_to_letter(*coordinates(player_square))
                 if key == self.king_letter:
                     continue
-                for potential_move in value:
-                    if move == potential_move:
-                        end_letter = self.coordinates_to_letter(move[0], move[1])
-                        alternative_moves.append((key, end_letter))
+                alternative_moves.append((key, end_letter))
+                # CASE: Promoted Notes and Governance list a square twice when they reach it both ways
+                piece = squares[player_square]
+                if piece in RAYS and piece in STEPS and STEP_MASKS[piece][player_square] & slider_attacks(squares, piece, player_square) & (1 << move_square):
+                    alternative_moves.append((key, end_letter))
         return alternative_moves
     # Returns moves that can be made by the king to move out of check
     def king_moves(self, king_moves, check_move):
@@ -446,8 +411,7 @@ class Board:
             winner = self.upper_winner(self.king, False)
             if edge:
                 winner = self.upper_winner(self.king, True)
-            print(winner, 'player wins.  Checkmate.')
-            sys.exit()
+            raise GameOver(self.game_outcome(winner, CHECKMATE))
     # Output for check
     def check_end(self, king_moves, check_move, check, edge):
         king_remaining_moves = list(set(king_moves)-set(check_move))
@@ -456,36 +420,35 @@ class Board:
             if edge:
                 winner = self.upper_winner(self.king, True)
             else:
-                print(winner, "player is in check!")
-                print("Available moves:")
+                self.write(winner, "player is in check!")
+                self.write("Available moves:")
                 king_remaining_moves = sorted(king_remaining_moves)
                 for move in king_remaining_moves:
                     move_letter = self.coordinates_to_letter(move[0], move[1])
-                    print("move", self.king_letter, move_letter)
+                    self.write("move", self.king_letter, move_letter)
     # Checks if a player is in check
     def check(self, edge=None):
         self.all_pieces = self.get_pieces()
         king_info, king_moves = self.king_information()
-        opp_case = self.king.lower() if self.king.isupper() else self.king.upper()
-        opponent_moves, opponent_move_dic = self.opponent_moves(opp_case)
-        check = self.count_check(opponent_moves)
-        opponent_moves_flat = list(set([move for sublist in opponent_moves for move in sublist]))
-        check_move = self.check_move(king_moves, opponent_moves_flat)
+        opp_side = LOWER if self.king.isupper() else UPPER
+        king_square = square(king_info[0], king_info[1])
+        # Number of opponent pieces attacking the king, read off the attack maps
+        check = self.bitboard.attack_count[opp_side][king_square]
+        check_move = self.check_move(king_moves, opp_side)
         # END: Checkmate
         self.checkmate_end(king_moves, check_move, edge)
-        opp_info = self.opp_info(opponent_move_dic)
-        _, player_move_dic = self.opponent_moves(self.king)
-        _, opponent_move_dic_no_flat = self.opponent_moves(opp_case, True)
+        # Squares of the opponent pieces that have the king in check
+        opp_squares = self.bitboard.attackers(opp_side, king_square)
         # CASE: Many moves is only an option if only one piece is keeping the king in check
-        if len(opp_info) == 1:
+        if len(opp_squares) == 1:
             # Determine continuous direction that opponent piece makes to king
-            update_to_king = self.opponent_moves_to_king(opponent_move_dic_no_flat, king_info)
+            update_to_king = self.opponent_moves_to_king(opp_squares[0], king_square)
             # CASE: Determine moves where a piece in player hand can be dropped to block check
             drop_moves = self.check_drop_moves(update_to_king)
             # Update moves to include the position of the piece putting king in check
-            update_to_king = self.update_to_king(opp_info, update_to_king)
+            update_to_king = self.update_to_king(opp_squares, update_to_king)
             # CASE: Determine player moves that aren't king to block
-            alternative_moves = self.alternative_moves(player_move_dic, update_to_king)
+            alternative_moves = self.alternative_moves(update_to_king)
         else:
             drop_moves, alternative_moves = [], []
         # CASE: Determine moves that can be made by the king to move out of check
@@ -495,21 +458,17 @@ class Board:
         # END: Check
         self.check_end(king_moves, check_move, check, edge)
         # ADDED, because I added a temporary + 1 for some case
-    # Add capture to capture hand of appropriate player
+    # Add capture to capture hand of appropriate player, returns the hand and serial it was added with
     def drop_remove_cap(self, potential_capture):
-        if potential_capture != 1:
-            if potential_capture.islower():
-                self.upper_cap.append(potential_capture.upper().strip()) 
-            else:
-                self.lower_cap.append(potential_capture.lower().strip())
-        return
-    # When piece is dropped, removes piece from capture hand
-    def check_piece_present(self):
-        if self.piece_type in self.upper_cap:
-            self.upper_cap.remove(self.piece_type)
-        elif self.piece_type in self.lower_cap:
-            self.lower_cap.remove(self.piece_type)
-        return
+        if potential_capture.islower():
+            return self.upper_cap, self.hand_add(self.upper_cap, potential_capture.upper().strip())
+        return self.lower_cap, self.hand_add(self.lower_cap, potential_capture.lower().strip())
+    # When piece is dropped, removes piece from capture hand, returns the hand and serial it was removed with
+    def check_piece_present(self, piece):
+        for hand in (self.upper_cap, self.lower_cap):
+            if piece in hand:
+                return hand, self.hand_remove(hand, piece)
+        return None, None
     # CASE: Preview dropped in state to check the other king
     # CASE: Piece dropped immediately causing mate
     def drop_preview_check(self):
@@ -523,20 +482,16 @@ class Board:
                 return True
         return False
     # CASE: Move puts move player in check illegally
-    def move_check(self):
-        self.all_pieces = self.get_pieces()
-        king = self.determine_king()
-        king_info = self.king_info(king)
-        opp_case = king.lower() if king.isupper() else king.upper()
-        opponent_moves, _ = self.opponent_moves(opp_case)
-        for opponent_piece in opponent_moves:
-            for move in opponent_piece:
-                if (king_info[0], king_info[1]) == move:
-                    return True
-        return False
+    # King defaults to the king of the player whose turn it is
+    def move_check(self, king=None):
+        king = king or self.determine_king()
+        opp_side = LOWER if king.isupper() else UPPER
+        return self.bitboard.attacked(opp_side, self.bitboard.find(king))
     # CASE: Immediate preview drop mate
+    # Read off the promotion zone mask of the dropping player
     def preview_drop(self):
-        return self.promotion_zone(self.piece_type, self.position)
+        row, col = self.board_coordinates(self.position)
+        return bool(ZONE_MASKS[side_of(self.piece_type)] >> square(row, col) & 1)
     # CASE: Preview illegal move to promotion zone
     def preview_no_promotion_area(self):
         _, col = self.board_coordinates(self.position)
@@ -550,17 +505,10 @@ class Board:
             self.piece_type = '+' + self.piece_type
         return
     # CASE: Double preview drop
+    # Read off the files the bitboard keeps for the Previews of the dropping player
     def preview_double(self):
-        row, _ = self.board_coordinates(self.position)
-        all_pieces = self.get_pieces()
-        compare = []
-        for piece in all_pieces:
-            if piece[2] == self.piece_type:
-                compare.append(piece)
-        for piece in compare:
-            if row == piece[0]:
-                return True
-        return False
+        row, col = self.board_coordinates(self.position)
+        return bool(self.bitboard.preview_files[side_of(self.piece_type)] >> square(row, col) & 1)
     def drop_own(self, cur_piece):
         for _, _, piece_type in self.all_pieces:
             if cur_piece.isupper() == piece_type.isupper():
@@ -577,54 +525,66 @@ class Board:
         if check != 0:
             # Person who didn't make last move in check is in check
             winner = self.upper_winner(self.piece_type, True) if king_info[2].isupper() else self.upper_winner(self.piece_type, False)
-            print(winner, "player is in check!")
-            print("Available moves:")
+            escape_moves = []
             if len(drop_moves) != 0:
                 moves = sorted(drop_moves)
                 for move in moves:
-                    print('drop',move[0], move[1])
+                    escape_moves.append('drop ' + move[0] + ' ' + move[1])
             moves = sorted(king_letter_moves + alternative_moves)
             for move in moves:
-                print("move", move[0], move[1])
-            print('UPPER>') if king_info[2].isupper() else print('lower>')
-            sys.exit()
+                escape_moves.append('move ' + move[0] + ' ' + move[1])
+            next_player = 'UPPER' if king_info[2].isupper() else 'lower'
+            raise GameOver(self.game_outcome(None, CHECK, winner, next_player, escape_moves))
     # Helper to output
     def report_recent_move(self):
-        print('UPPER player action:', self.last_move[1]) if self.last_move[0] else print('lower player action:', self.last_move[1])
+        self.write('UPPER player action:', self.last_move[1]) if self.last_move[0] else self.write('lower player action:', self.last_move[1])
     # Helper to output
     def report_end_capture(self):
         upper = "Captures UPPER: " + self.capture_string(self.upper_cap)
         lower = "Captures lower: " + self.capture_string(self.lower_cap)
-        print(upper.strip())
-        print(lower.strip())
+        self.write(upper.strip())
+        self.write(lower.strip())
     # Helper to output
     def illegal(self):
         if self.illegal_tuple[0]:
-            print(self.illegal_tuple[1], 'player wins.  Illegal move.')
-            sys.exit()
+            raise GameOver(self.game_outcome(self.illegal_tuple[1], ILLEGAL_MOVE))
     # END: Too many moves
     def tie_game(self):
-        if self.turn == 400:
+        if self.turn == MAX_PLIES:
             self.check(True)
-        if self.turn > 399:
-            print()
-            print('Tie game.  Too many moves.')
-            sys.exit()
+        if self.turn >= MAX_PLIES:
+            self.write()
+            raise GameOver(self.game_outcome(None, TOO_MANY_MOVES))
+    # END: Position repeated as often as the repetition rule allows, never without one
+    def repetition_game(self):
+        if self.repetitions and self.position_occurred(self.repetitions):
+            self.write()
+            raise GameOver(self.game_outcome(None, REPETITION))
     # Helper to output
     def report_next_player_output(self):
         if self.interactive:
             if not self.illegal_tuple[0]:
-                return input('lower>') if self.last_move[0] else input('UPPER>')
+                return self.read_move('lower') if self.last_move[0] else self.read_move('UPPER')
         if not self.illegal_tuple[0]:
-            print('lower>') if self.last_move[0] else print('UPPER>')
+            self.write('lower>') if self.last_move[0] else self.write('UPPER>')
             return
+    # Next move of player in interactive mode, from their engine when they have one
+    # The engine move is written after the prompt like a typed move would be
+    def read_move(self, player):
+        engine = self.players.get(player)
+        move = engine.choose_text(self) if engine else None
+        if move is None:
+            return input(player + '>')
+        self.write(player + '>' + move)
+        return move
     # END: Output if a valid move in interactive or all moves in file are made
     def final_print_f(self):
         self.report_recent_move()
-        print(self.__str__())
+        self.write(self.__str__())
         self.report_end_capture()
         self.tie_game()
-        print()
+        self.repetition_game()
+        self.write()
         self.check()
         self.illegal()
         if self.interactive:
@@ -639,91 +599,18 @@ class Board:
     def illegal_output(self):
         self.end_early()
         self.report_recent_move()
-        print(self.__str__())
+        self.write(self.__str__())
         self.report_end_capture()
-        print()
+        self.write()
         self.illegal()
-        sys.exit()
-    # Helper for pieces with continuous direction moves, but directions are not flattened
-    def valid_dynamic_block(self, start_row, start_col, cur_piece, index, is_check):
-        valid_moves = []
-        for direction in self.directions[index]:
-            temp_valid_moves = []
-            r, c = direction
-            new_row, new_col = start_row + r, start_col + c
-            while 0 <= new_row < self.BOARD_SIZE and 0 <= new_col < self.BOARD_SIZE:
-                block_found = False
-                for block in self.all_pieces:
-                    if not is_check:
-                        if block[2].isupper() != cur_piece.isupper():
-                            temp_valid_moves.append((new_row, new_col))
-                            break
-                    elif is_check:
-                        if (block[0], block[1]) == (new_row, new_col):
-                            if block[2].lower() == 'd' and block[2].isupper() != cur_piece.isupper():
-                                temp_valid_moves.append((new_row, new_col))
-                            block_found = True
-                            break  
-                if block_found:
-                    break
-                temp_valid_moves.append((new_row, new_col))
-                new_row += r
-                new_col += c
-            valid_moves.append(temp_valid_moves)
-        return valid_moves
-    # Helper for pieces without continuous direction moves, but directions are not flattened
-    def valid_static_block(self, start_row, start_col, cur_piece, index, is_check):
-        valid_moves = []
-        for direction in self.directions[index]:
-            temp_valid_moves = []
-            r, c = direction
-            new_row, new_col = start_row + r, start_col + c
-            if 0 <= new_row < 5 and 0 <= new_col < 5:
-                for block in self.all_pieces:
-                    block_found = False
-                    for block in self.all_pieces:
-                        if block[0] == new_row and block[1] == new_col:
-                            block_found = True
-                            if not is_check:
-                                if block[2].isupper() != cur_piece.isupper():
-                                    temp_valid_moves.append((new_row, new_col))
-                                    break
-                            elif is_check:
-                                if (block[0], block[1]) == (new_row, new_col):
-                                    temp_valid_moves.append((new_row, new_col))
-                                    block_found = True
-                                    break
-                    if block_found:
-                        break
-                    temp_valid_moves.append((new_row, new_col))
-            valid_moves.append(temp_valid_moves)
-        return valid_moves
-    # Returns valid moves for a piece in an unflattened array
-    def valid_block(self, cur_piece, start_position, is_check):
-        lower_label = cur_piece.lower()
-        start_row, start_col = self.board_coordinates(start_position)
-        self.directions = self.get_piece_moves(lower_label)
-        if cur_piece.isupper():
-            self.directions = self.mirror_directions()
-        val_moves = []
-        # Dynamic
-        if lower_label in ['n', 'g']:
-            val_moves.append(self.valid_dynamic_block(start_row, start_col, cur_piece, 0, is_check))
-        # Static
-        elif lower_label in ['d', 's', 'r', 'p', '+r', '+p']:
-            val_moves.append(self.valid_static_block(start_row, start_col, cur_piece, 0, is_check))
-        # Dynamic then Static
-        elif lower_label in ['+n', "+g"]:
-            val_moves.append(self.valid_dynamic_block(start_row, start_col, cur_piece, 0, is_check))
-            val_moves.append(self.valid_static_block(start_row, start_col, cur_piece, 1, is_check))
-        return val_moves
     def shogi_main(self, move):
         self.all_pieces = self.get_pieces()
+        turn = self.turn
         for _ in range(1):
             move_info = move.strip().split()
             self.move = move
             if move_info[0] == "move":
-                start, end_row, end_col, tmp_board, move_info_len, tmp_start_piece, valid_moves = self.move_information(move_info)
+                start, end_row, end_col, move_info_len, tmp_start_piece, valid_moves = self.move_information(move_info)
                 if(end_row, end_col) in valid_moves:
                     # CASE: Forced preview promotion
                     if self.piece_type.lower() == 'p':
@@ -737,19 +624,27 @@ class Board:
                         self.piece_type = tmp_start_piece
                         self.illegal_output()
                     # BASE
-                    self.remove_piece(start)
-                    potential_capture = self.add_piece()
+                    king = self.determine_king()
+                    end_piece = self.get_piece(self.position)
+                    # CASE: Moving onto own piece loses the moving piece
+                    if end_piece != EMPTY and end_piece.isupper() == self.piece_type.isupper():
+                        # Nothing lands on end, undoing it puts the moving piece back on start
+                        start_square = self.board_index(*self.board_coordinates(start))
+                        record = MoveRecord(start_square, self.board_index(end_row, end_col), self.bitboard.remove(start_square), end_piece, end_piece, False, None, None)
+                        self.turn += 1
+                        self.history.push(self.position_key())
+                    else:
+                        record = self.make_move(self.board_index(*self.board_coordinates(start)), self.board_index(end_row, end_col), self.piece_type)
                     # CASE: Move puts move player in check illegally
-                    if self.move_check() and self.piece_type.lower() == 'd':
-                        self._board = tmp_board
+                    if self.move_check(king) and self.piece_type.lower() == 'd':
+                        self.unmake_move(record)
                         self.piece_type = tmp_start_piece
                         self.illegal_output()
-                    self.drop_remove_cap(potential_capture)
                 else:
                     self.end_early()
                     break
             elif move_info[0] == "drop":
-                row, col, cur_piece, tmp_board, tmp_lower_cap, tmp_upper_cap = self.drop_information(move_info)
+                row, col, cur_piece = self.drop_information(move_info)
                 if cur_piece == '__':
                     # Sets the piece type to upper or lower
                     # CASE: Drop piece not in hand
@@ -760,7 +655,7 @@ class Board:
                     if ((self.piece_type.islower() and self.piece_type not in self.lower_cap) or (self.piece_type.isupper() and self.piece_type not in self.upper_cap)) or len(self.upper_cap) == 0 or len(self.lower_cap) == 0 or (self.piece_type not in self.upper_cap and self.piece_type not in self.lower_cap) or (self.piece_type.lower() == 'p' and self.preview_drop()) or (self.piece_type.lower() == 'p' and self.preview_double()):
                         self.illegal_output()
                     # BASE
-                    self.drop_move_base(row, col)
+                    record = self.drop_move_base(row, col)
                 else:
                     if cur_piece == self.piece_type:
                         self.end_early()
@@ -770,24 +665,82 @@ class Board:
                         self.illegal_output()
                 # CASE: Preview dropped in state to check the other king
                 if self.drop_preview_check() and self.piece_type.lower() == 'p':
-                    self._board = tmp_board
-                    self.upper_cap = tmp_upper_cap
-                    self.lower_cap = tmp_lower_cap
+                    self.unmake_move(record)
                     self.illegal_output()
+            # CASE: Nothing moved, like a drop on the other player's piece, the turn passes all the same
+            if self.turn == turn:
+                self.turn += 1
+                self.history.push(self.position_key())
             self.last_move = [self.piece_type.isupper(), move]
-            self.turn += 1
         return
-    # Function call to run test file mode
+    # Function call to run test file mode, returns the Outcome once the moves run out or the game ends
     def play_file(self):
         self.init_board()
-        for move in self.move_state:
-            self.shogi_main(move)
-        self.final_print_f()
-    # Function call to play interactive mode
+        try:
+            for move in self.move_state:
+                self.shogi_main(move)
+            self.final_print_f()
+        except GameOver as game_over:
+            return game_over.outcome
+        return self.game_outcome(next_player='lower' if self.last_move[0] else 'UPPER')
+    # Function call to play interactive mode, returns the Outcome once the game ends
     def play_interactive(self):
         tmp = None
-        move = self.start_output_interactive()
-        while move != tmp:
-            tmp = move
-            self.shogi_main(move)
-            move = self.final_print_f()
+        try:
+            move = self.start_output_interactive()
+            while move != tmp:
+                tmp = move
+                self.shogi_main(move)
+                move = self.final_print_f()
+        except GameOver as game_over:
+            return game_over.outcome
+        return self.game_outcome(next_player='lower' if self.last_move[0] else 'UPPER')
+
+# Board set up with the pieces, captures and moves of a test case from utils.parseTestCase
+def case_board(case, out=None):
+    game_board = Board(None, case['moves'], case['initialPieces'], list(case['upperCaptures']), list(case['lowerCaptures']), (False, ''), 0, None, None, None, out=out)
+    game_board.init_board()
+    return game_board
+# Board of a test case with its moves played the way file mode plays them, NAME is the file in errors
+# Raises utils.TestCaseError at the first move file mode refuses or fails on, the moves after it are not played
+def played_board(case, name='<case>'):
+    game_board = case_board(dict(case, moves=[]), out=io.StringIO())
+    for index, move in enumerate(case['moves']):
+        try:
+            game_board.shogi_main(move)
+            refused = game_board.illegal_tuple[0]
+        except Exception:
+            refused = True
+        if refused:
+            # Moves start after the pieces, a blank line, both capture hands and another blank line
+            raise TestCaseError(name, len(case['initialPieces']) + 5 + index, 'file mode refuses the move %r' % move)
+    return game_board
+# Board set up from a test case file with its moves played, see played_board
+def case_position(path):
+    return played_board(parseTestCase(path), path)
+# Board set up with the starting pieces of interactive mode
+def start_board(out=None):
+    game_board = Board(None, [], None, [], [], (False, ''), 0, None, None, None, out=out)
+    game_board.initial_state = game_board.init_interactive_pieces()
+    game_board.init_board()
+    return game_board
+# Position of game_board another Board, in this process or another, can be set up from:
+# squares, UPPER hand, lower hand and turn
+def position(game_board):
+    return tuple(game_board.bitboard.squares), tuple(game_board.upper_cap), tuple(game_board.lower_cap), game_board.turn
+# Board of a position from position()
+def position_board(state, out=None):
+    squares, upper_cap, lower_cap, turn = state
+    initial_state = []
+    for sq, piece in enumerate(squares):
+        if piece != EMPTY:
+            row, col = coordinates(sq)
+            initial_state.append({'piece': piece, 'position': chr(ord('a') + row) + str(col + 1)})
+    game_board = Board(None, [], initial_state, list(upper_cap), list(lower_cap), (False, ''), turn, None, None, None, out=out)
+    game_board.init_board()
+    return game_board
+# Plays a test case from utils.parseTestCase in file mode and returns its Outcome
+# Output is written to out, pass an io.StringIO to keep it or os.devnull to drop it
+def play_case(case, out=None):
+    game_board = Board(None, case['moves'], case['initialPieces'], list(case['upperCaptures']), list(case['lowerCaptures']), (False, ''), 0, None, None, None, out=out)
+    return game_board.play_file()
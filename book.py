@@ -0,0 +1,161 @@
+"""
+Opening book, the moves a corpus of games played from its first positions.
+
+    python3 boxshogi.py -o build <book file> <corpus> [<corpus> ...] [-d <plies>] [-c <min games>]
+    python3 boxshogi.py -o show <book file> <case file>
+
+A corpus is a test case file of one or many games, a gamerecord file, a
+directory of case files or a glob of them, or - for standard input, read as
+it goes. Every game is replayed up to the end of its moves or the first one
+the board rules of engine.playable refuse, and the position before each of
+its first plies, DEFAULT_PLIES by default, counts the move played from it
+with the result of the game for the player who played it. A player wins
+when their opponent has no move at the end of the game or played the move
+that was refused, anything else is a draw. Moves played in fewer than -c
+games are left out.
+
+Book players skip their search while the book has the position, engine
+players play its most played move and self-play games a random one weighted
+by games.
+
+File layout, integers little endian:
+
+    header   b'BSOB', version (1 byte), plies (2 bytes), entry count (4 bytes)
+    entries  position key (8 bytes), move (2 bytes), games, wins and draws (4 bytes each),
+             sorted by position key and move
+"""
+import mmap
+import struct
+import sys
+import board
+import engine
+import gamerecord
+import movegen
+from utils import corpus_cases, parse_options
+
+MAGIC = b'BSOB'
+VERSION = 1
+HEADER = struct.Struct('<4sBHI')
+ENTRY = struct.Struct('<QHIII')
+KEY = struct.Struct('<Q')
+# Plies of every game the book keeps
+DEFAULT_PLIES = 16
+
+# (position key, move code) before each of the first plies of a game and its result
+# for the player to move there, 1 for a win, 0 for a draw and -1 for a loss
+def game_moves(case, plies):
+    game_board = board.case_board(case)
+    steps = []
+    winner = None
+    for text in case['moves']:
+        side = movegen.side_to_move(game_board)
+        try:
+            move = movegen.parse_move(game_board, text)
+        except ValueError:
+            move = None
+        if move is None or move not in movegen.pseudo_moves(game_board, side) or not engine.playable(game_board, move, side):
+            winner = 1 - side
+            break
+        if len(steps) < plies:
+            steps.append((game_board.position_key(), movegen.encode_move(move), side))
+        game_board.make_move(*move)
+    else:
+        if not engine.playable_moves(game_board):
+            winner = 1 - movegen.side_to_move(game_board)
+    return [(key, code, 0 if winner is None else 1 if side == winner else -1) for key, code, side in steps]
+
+# Adds the moves of the first plies of every game of sources to a dict of
+# (position key, move code) to [games, wins, draws], returns the games read
+def count_moves(sources, plies, counts):
+    games = 0
+    for source in sources:
+        for case in corpus_cases(source):
+            games += 1
+            for key, code, result in game_moves(case, plies):
+                entry = counts.get((key, code))
+                if entry is None:
+                    entry = counts[(key, code)] = [0, 0, 0]
+                entry[0] += 1
+                if result > 0:
+                    entry[1] += 1
+                elif result == 0:
+                    entry[2] += 1
+    return games
+# Builds a book of the first plies of the games of sources, returns (games, entries)
+def write_book(path, sources, plies=DEFAULT_PLIES, min_games=1):
+    counts = {}
+    games = count_moves(sources, plies, counts)
+    entries = sorted((key, code, totals) for (key, code), totals in counts.items() if totals[0] >= min_games)
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, plies, len(entries)))
+        for key, code, (played, wins, draws) in entries:
+            f.write(ENTRY.pack(key, code, played, wins, draws))
+    return games, len(entries)
+
+class Book:
+    """
+    Class that looks positions up in a book file by binary search without reading it into memory
+    """
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.plies, self.count = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError('%s is not a version %d book file' % (path, VERSION))
+    def __len__(self):
+        return self.count
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc_info):
+        self.close()
+    def close(self):
+        self.data.close()
+        self.file.close()
+    # Number of the first entry whose position key is not below key
+    def _first_entry(self, key):
+        data = self.data
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if KEY.unpack_from(data, HEADER.size + middle * ENTRY.size)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+    # (move, games, wins, draws, losses) of every book move of game_board, most played first
+    # The moves were played in a position with the same key, pieces, hands and side to move
+    def moves(self, game_board):
+        key = game_board.position_key()
+        found = []
+        for entry in range(self._first_entry(key), self.count):
+            entry_key, code, played, wins, draws = ENTRY.unpack_from(self.data, HEADER.size + entry * ENTRY.size)
+            if entry_key != key:
+                break
+            found.append((movegen.decode_move(code), played, wins, draws, played - wins - draws))
+        found.sort(key=lambda found_move: found_move[1], reverse=True)
+        return found
+    # Book move of game_board, the most played or, with rng, a random one weighted by games
+    # None when the position is not in the book
+    def choose(self, game_board, rng=None):
+        found = self.moves(game_board)
+        if not found:
+            return None
+        if rng is None:
+            return found[0][0]
+        return rng.choices([move for move, *_ in found], [played for _, played, *_ in found])[0]
+
+# Command line for opening books, args are the arguments after -o
+def main(args):
+    if args[0] == 'build':
+        sources, options = parse_options(args[2:], ('-d', '-c'))
+        games, entries = write_book(args[1], sources, int(options.get('-d', DEFAULT_PLIES)), int(options.get('-c', 1)))
+        print('%d games, %d book moves written to %s' % (games, entries, args[1]), file=sys.stderr)
+    elif args[0] == 'show':
+        with Book(args[1]) as book:
+            game_board = board.case_position(args[2])
+            found = book.moves(game_board)
+            if not found:
+                print('Not in the book')
+            for move, played, wins, draws, losses in found:
+                print('%s  %d games, +%d =%d -%d' % (movegen.format_move(game_board, move), played, wins, draws, losses))
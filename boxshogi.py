@@ -1,12 +1,16 @@
 import sys
 from utils import parseTestCase
+from outcome import render
 import board
+import profiling
 import copy
 
 def main():
     """
     Main function to read terminal input
     """
+    # Phase timings when BOXSHOGI_PROFILE is set, see profiling.py
+    profiling.from_environment()
     if sys.argv[1] == '-f':
 
         dic = parseTestCase(sys.argv[2])
@@ -14,16 +18,80 @@ def main():
         turn, illegal_tuple = 0, (False, '')
         move, last_move, piece_type, position = None, None, None, None
         game_board = board.Board(move, moveState, initialState, upperCap, lowerCap, illegal_tuple, turn, last_move, piece_type, position)
-        game_board.play_file()
+        outcome = game_board.play_file()
+        print(render(outcome), end='')
 
-    # Interactive mode
+    # Interactive mode, -e lower|UPPER|both lets the engine play a side, -t sets its milliseconds per move
+    # -a mcts makes it the Monte Carlo tree search player, -w sets its rollout processes
+    # -r ends the game in a tie once a position occurs that many times
+    # -o gives the engine players an opening book, see book.py
+    # Every mode imports its modules when it runs, so one mode does not pay for loading the others
     if sys.argv[1] == '-i':
+        import engine
         
         upperCap, lowerCap = [], []
         turn, illegal_tuple = 0, (False, '')
         move, last_move, moveState, initialState, piece_type, position = None, None, None, None, None, None
-        game_board = board.Board(move, moveState, initialState, upperCap, lowerCap, illegal_tuple, turn, last_move, piece_type, position, True)
-        game_board.play_interactive()
+        options = dict(zip(sys.argv[2::2], sys.argv[3::2]))
+        repetitions = int(options['-r']) if '-r' in options else None
+        if options.get('-a') == 'mcts':
+            import mcts
+            players = mcts.players(sys.argv[2:])
+        else:
+            players = engine.players(sys.argv[2:])
+        if '-o' in options:
+            import book
+            opening_book = book.Book(options['-o'])
+            for player in players.values():
+                player.book = opening_book
+        game_board = board.Board(move, moveState, initialState, upperCap, lowerCap, illegal_tuple, turn, last_move, piece_type, position, True, players=players, repetitions=repetitions)
+        outcome = game_board.play_interactive()
+        print(render(outcome), end='')
+
+    # Batch mode
+    if sys.argv[1] == '-b':
+        import batch
+        batch.main(sys.argv[2:])
+
+    # Perft mode
+    if sys.argv[1] == '-p':
+        import perft
+        perft.main(sys.argv[2:])
+
+    # Mate solver mode
+    if sys.argv[1] == '-m':
+        import mate
+        mate.main(sys.argv[2:])
+
+    # Game record mode
+    if sys.argv[1] == '-g':
+        import gamerecord
+        gamerecord.main(sys.argv[2:])
+
+    # Self-play mode
+    if sys.argv[1] == '-s':
+        import selfplay
+        selfplay.main(sys.argv[2:])
+
+    # Tablebase mode
+    if sys.argv[1] == '-t':
+        import tablebase
+        tablebase.main(sys.argv[2:])
+
+    # Opening book mode
+    if sys.argv[1] == '-o':
+        import book
+        book.main(sys.argv[2:])
+
+    # Game server mode
+    if sys.argv[1] == '-n':
+        import server
+        server.main(sys.argv[2:])
+
+    # Differential fuzzing mode
+    if sys.argv[1] == '-d':
+        import fuzz
+        fuzz.main(sys.argv[2:])
         
 
 if __name__ == "__main__":
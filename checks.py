@@ -0,0 +1,160 @@
+"""
+Equivalence checks, the compact and fast stand-ins of BoxShogi against what they stand in for.
+
+    python3 checks.py gamerecord <test case file or -> [record file]
+    python3 checks.py replay <corpus> [<corpus> ...] [-n <seeks per game>] [-s <seed>]
+    python3 checks.py movegen [<corpus> ...] [-n <random games>] [-s <seed>]
+
+gamerecord writes the test cases to a record file, a temporary one unless
+given, reads them back and compares every game with the case it came from.
+
+replay seeks a Replay of every game of the corpora, read by
+utils.corpus_cases, to random plies and compares its board with one that
+played the moves up to that ply from the start: pieces, hands, turn, last
+move, attack maps, Zobrist keys and position history.
+
+movegen compares the move count and check of every position from
+vectorized, all in one batch per rule set, with engine.playable_moves under
+the board rules and movegen.legal_moves under the README rules: the
+positions of the corpora up to the first move Board does not play, and of
+-n random games from the start, each up to CHECK_PLIES plies. It needs
+NumPy, the other checks do not.
+
+Every check reports what differs on standard error along with a count, and
+the exit status is 1 when anything differs.
+"""
+import os
+import random
+import sys
+import tempfile
+import board
+import engine
+import gamerecord
+import movegen
+from replay import Replay
+from utils import corpus_cases, iterTestCases, parse_options
+
+# Writes the test cases of source to a record file and reads them back
+# Returns (games, numbers of the games that came back different)
+def round_trip(source, path):
+    cases = list(iterTestCases(source))
+    gamerecord.write_records(path, cases)
+    with gamerecord.GameRecords(path) as records:
+        return len(cases), [k for k, case in enumerate(cases) if records[k] != case]
+# Text -> binary -> text check, args are the arguments after gamerecord, returns whether every game matched
+def check_gamerecord(args):
+    if len(args) > 1:
+        games, different = round_trip(args[0], args[1])
+    else:
+        handle, path = tempfile.mkstemp(suffix='.bsgr')
+        os.close(handle)
+        try:
+            games, different = round_trip(args[0], path)
+        finally:
+            os.remove(path)
+    for k in different:
+        print('game %d differs after text -> binary -> text' % k, file=sys.stderr)
+    print('%d games, %d differ' % (games, len(different)), file=sys.stderr)
+    return not different
+
+# Everything a seek has to put back on a board, to compare with a board that played the moves
+def board_state(game_board):
+    bitboard = game_board.bitboard
+    masks = {piece: mask for piece, mask in bitboard.masks.items() if mask}
+    last_move = list(game_board.last_move) if game_board.last_move else game_board.last_move
+    return (tuple(bitboard.squares), masks, tuple(bitboard.occupied), bitboard.key, tuple(bitboard.preview_files),
+            tuple(bitboard.attacks_from), tuple(map(tuple, bitboard.attack_count)), bitboard.sliders,
+            tuple(game_board.upper_cap), tuple(game_board.lower_cap), game_board.turn, last_move,
+            game_board.piece_type, game_board.position, game_board.position_key(), tuple(game_board.history.keys))
+# Seeks a replay of case to seeks random plies, returns the plies whose board differed
+def seek_case(case, seeks, rng):
+    replay = Replay(case)
+    different = []
+    for _ in range(seeks):
+        ply = rng.randint(0, len(replay))
+        played = Replay(dict(case, moves=case['moves'][:ply])).board
+        if board_state(replay.seek(ply)) != board_state(played):
+            different.append(ply)
+    return different
+# Replay seek check, args are the arguments after replay, returns whether every seek matched
+def check_replay(args):
+    sources, options = parse_options(args, ('-n', '-s'))
+    rng = random.Random(int(options.get('-s', 0)))
+    seeks = int(options.get('-n', 10))
+    games, failures = 0, 0
+    for source in sources:
+        for case in corpus_cases(source):
+            for ply in seek_case(case, seeks, rng):
+                print('game %d: seek to ply %d differs from playing the moves' % (games, ply), file=sys.stderr)
+                failures += 1
+            games += 1
+    print('%d games, %d seeks, %d differ' % (games, games * seeks, failures), file=sys.stderr)
+    return not failures
+
+# Most plies of a random game of the movegen check
+CHECK_PLIES = 60
+# (board.position(), move counts under the board and README rules, check) of the position of game_board
+def check_position(game_board):
+    counts = (len(engine.playable_moves(game_board)), len(movegen.legal_moves(game_board)))
+    return board.position(game_board), counts, movegen.in_check(game_board)
+# Check positions of every position of a game up to the first move Board does not play
+def case_positions(case):
+    game_board = board.case_board(case)
+    positions = [check_position(game_board)]
+    for text in case['moves']:
+        try:
+            move = movegen.parse_move(game_board, text)
+        except ValueError:
+            break
+        if move not in engine.playable_moves(game_board):
+            break
+        game_board.make_move(*move)
+        positions.append(check_position(game_board))
+    return positions
+# Check positions of a random game from the start
+def random_positions(rng):
+    game_board = board.start_board()
+    positions = [check_position(game_board)]
+    for _ in range(CHECK_PLIES):
+        move = engine.random_move(game_board, rng)
+        if move is None:
+            break
+        game_board.make_move(*move)
+        positions.append(check_position(game_board))
+    return positions
+# Batch move generation check, args are the arguments after movegen, returns whether every position matched
+def check_movegen(args):
+    # NumPy is only needed by this check
+    import vectorized
+    sources, options = parse_options(args, ('-n', '-s'))
+    positions = []
+    for source in sources:
+        for case in corpus_cases(source):
+            positions.extend(case_positions(case))
+    rng = random.Random(int(options.get('-s', 0)))
+    for _ in range(int(options.get('-n', 100))):
+        positions.extend(random_positions(rng))
+    arrays = vectorized.encode([board.position_board(state) for state, _, _ in positions])
+    failures = 0
+    for index, rules in enumerate(vectorized.RULES):
+        legal = vectorized.legal_moves(*arrays, rules=rules)
+        counts = vectorized.move_counts(legal)
+        for n, (_, expected, in_check) in enumerate(positions):
+            if counts[n] != expected[index] or legal.in_check[n] != in_check:
+                print('position %d: move count or check differs from the %s rules' % (n, rules), file=sys.stderr)
+                failures += 1
+    print('%d positions, %d rule sets, %d differ' % (len(positions), len(vectorized.RULES), failures), file=sys.stderr)
+    return not failures
+
+CHECKS = {'gamerecord': check_gamerecord, 'replay': check_replay, 'movegen': check_movegen}
+
+# Command line for the checks, args are the arguments after checks.py
+def main(args):
+    if not args or args[0] not in CHECKS:
+        print('usage: python3 checks.py %s ...' % '|'.join(CHECKS), file=sys.stderr)
+        sys.exit(2)
+    if not CHECKS[args[0]](args[1:]):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
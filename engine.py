@@ -0,0 +1,250 @@
+"""
+Alpha-beta engine that plays either side of interactive mode.
+
+The engine searches with iterative deepening until its time budget per move
+runs out and plays the best move of the deepest search that finished.
+Positions are cached in a fixed-size transposition table keyed by
+Board.position_key(), a slot keeps the entry searched deepest. A position
+the game or the search line already went through scores as a draw, so the
+search does not spend its time on lines that go round in circles.
+"""
+import time
+from bitboard import BOARD_SIZE, EMPTY, UPPER, side_of
+import movegen
+from movecache import MoveCache
+
+# Piece values in tenths of a Preview, hand pieces count a little more for their drop
+VALUES = {
+    'd': 0, 's': 60, 'r': 50, 'g': 80, 'n': 100, 'p': 10,
+    '+r': 60, '+g': 100, '+n': 120, '+p': 60,
+}
+VALUES.update({label.upper(): value for label, value in list(VALUES.items())})
+HAND_BONUS = 5
+# Board.preview_no_promotion_area: a promoted Preview cannot move to the first rank of its side
+PROMOTED_PREVIEWS = ('+p', '+P')
+FIRST_RANKS = (0, BOARD_SIZE - 1)
+# Score of a position where the player to move has no move, nearer mates score higher
+MATE = 100000
+# Score of a position repeated in the game or the search line
+DRAW = 0
+# Deeper than any search, scores within MAX_PLY of MATE are mates
+MAX_PLY = 1000
+# Transposition table entry bounds
+EXACT = 0
+LOWER_BOUND = 1
+UPPER_BOUND = 2
+
+# Mate scores count plies from the root, the table stores them counted from the position
+def to_table(score, ply):
+    if score >= MATE - MAX_PLY:
+        return score + ply
+    if score <= -MATE + MAX_PLY:
+        return score - ply
+    return score
+def from_table(score, ply):
+    if score >= MATE - MAX_PLY:
+        return score - ply
+    if score <= -MATE + MAX_PLY:
+        return score + ply
+    return score
+
+# Whether Board plays a move of side from movegen.pseudo_moves without ending the game as illegal
+# Besides the README rules, Board.shogi_main rejects a drop while either capture hand is empty,
+# a Preview drop that checks the other king and a promoted Preview moving to its own first rank
+def playable(game_board, move, side):
+    start, end, piece = move
+    if start is None and not (game_board.upper_cap and game_board.lower_cap):
+        return False
+    if piece in PROMOTED_PREVIEWS and end % BOARD_SIZE == FIRST_RANKS[side]:
+        return False
+    record = game_board.make_move(*move)
+    legal = not movegen.king_attacked(game_board, side)
+    if legal and start is None and piece in movegen.PREVIEWS:
+        legal = not movegen.king_attacked(game_board, 1 - side)
+    game_board.unmake_move(record)
+    return legal
+# Every move of the player to move that Board plays
+def playable_moves(game_board):
+    side = movegen.side_to_move(game_board)
+    return [move for move in movegen.pseudo_moves(game_board, side) if playable(game_board, move, side)]
+# Random move Board plays, None if there is none
+# Pseudo moves are tried in random order, so every playable move is as likely
+def random_move(game_board, rng):
+    side = movegen.side_to_move(game_board)
+    moves = movegen.pseudo_moves(game_board, side)
+    rng.shuffle(moves)
+    for move in moves:
+        if playable(game_board, move, side):
+            return move
+    return None
+# Score of game_board for the player to move, material on the board and in hand
+def evaluate(game_board):
+    score = 0
+    for piece in game_board.bitboard.squares:
+        if piece != EMPTY:
+            score += VALUES[piece] if side_of(piece) == UPPER else -VALUES[piece]
+    for piece, count in game_board.upper_cap.items():
+        score += (VALUES[piece] + HAND_BONUS) * count
+    for piece, count in game_board.lower_cap.items():
+        score -= (VALUES[piece] + HAND_BONUS) * count
+    return score if movegen.side_to_move(game_board) == UPPER else -score
+
+class SearchTimeout(Exception):
+    """
+    Raised inside the search when the time budget of a move runs out
+    """
+
+class Engine:
+    """
+    Class that picks moves for one player with iterative deepening alpha-beta
+    """
+    # TIME_LIMIT: Seconds to spend on a move
+    # MAX_DEPTH: Deepest search in plies
+    # TABLE_BITS: The transposition table has 2 ** TABLE_BITS slots
+    # CACHE_SIZE: Positions whose move lists are kept between searches, 0 for none
+    # TABLEBASES: tablebase.Tablebases built with the board rules, positions it covers are scored from it
+    # BOOK: book.Book whose most played move is played without a search while it has the position
+    def __init__(self, time_limit=0.1, max_depth=32, table_bits=16, cache_size=65536, tablebases=None, book=None):
+        self.time_limit = time_limit
+        self.max_depth = max_depth
+        # TABLE: Slot to (key, depth, score, bound, move), None when empty
+        self.table = [None] * (1 << table_bits)
+        self.table_mask = (1 << table_bits) - 1
+        self.nodes = 0
+        self.depth = 0
+        self.deadline = None
+        self.cache = MoveCache(self.generate_moves, cache_size) if cache_size else None
+        self.tablebases = tablebases
+        self.book = book
+    # Move tuple for the player whose turn it is on game_board, None if they have none
+    def choose(self, game_board):
+        self.nodes = 0
+        if self.book is not None:
+            move = self.book.choose(game_board)
+            if move is not None:
+                self.depth = 0
+                return move
+        self.deadline = time.perf_counter() + self.time_limit
+        moves = self.moves(game_board)
+        if not moves:
+            return None
+        best = moves[0]
+        for depth in range(1, self.max_depth + 1):
+            try:
+                score, move = self.search_root(game_board, moves, depth)
+            except SearchTimeout:
+                break
+            best, self.depth = move, depth
+            # The move that was best is searched first at the next depth
+            moves.remove(move)
+            moves.insert(0, move)
+            if abs(score) >= MATE - MAX_PLY:
+                break
+        return best
+    # Text of the move to play, like the moves of a test case file
+    def choose_text(self, game_board):
+        move = self.choose(game_board)
+        return None if move is None else movegen.format_move(game_board, move)
+    # Moves of the player to move, from the move cache when the position was seen before
+    def moves(self, game_board):
+        if self.cache is not None:
+            return self.cache.moves(game_board)
+        return self.generate_moves(game_board)
+    # Moves of the player to move that Board accepts, ordered captures and promotions first
+    def generate_moves(self, game_board):
+        moves = playable_moves(game_board)
+        squares = game_board.bitboard.squares
+        moves.sort(key=lambda move: self.order(squares, move), reverse=True)
+        return moves
+    # Ordering score of a move, most valuable capture by the least valuable piece first
+    def order(self, squares, move):
+        start, end, piece = move
+        captured = squares[end]
+        score = VALUES[captured] * 16 if captured != EMPTY else 0
+        if start is not None:
+            moved = squares[start]
+            score += VALUES[piece] - VALUES[moved] - VALUES[moved] // 16
+        return score
+    # Searches every root move to depth, returns (score, best move)
+    def search_root(self, game_board, moves, depth):
+        alpha, best = -MATE - 1, moves[0]
+        for move in moves:
+            record = game_board.make_move(*move)
+            try:
+                score = -self.search(game_board, depth - 1, -MATE - 1, -alpha, 1)
+            finally:
+                game_board.unmake_move(record)
+            if score > alpha:
+                alpha, best = score, move
+        self.store(game_board.position_key(), depth, alpha, EXACT, best)
+        return alpha, best
+    # Negamax alpha-beta score of game_board for the player to move
+    def search(self, game_board, depth, alpha, beta, ply):
+        self.nodes += 1
+        # A node generates and tries every move, so the clock is cheap next to it
+        if time.perf_counter() > self.deadline:
+            raise SearchTimeout()
+        key = game_board.position_key()
+        if game_board.history.occurred(key, 2):
+            return DRAW
+        if self.tablebases is not None:
+            found = self.tablebases.probe(game_board)
+            if found is not None:
+                # Result 1, 0 or -1 for a win, draw or loss of the player to move, mated plies from now
+                result, plies = found
+                return result * (MATE - ply - plies)
+        entry = self.table[key & self.table_mask]
+        tt_move = None
+        if entry is not None and entry[0] == key:
+            _, entry_depth, score, bound, tt_move = entry
+            score = from_table(score, ply)
+            if entry_depth >= depth:
+                if bound == EXACT:
+                    return score
+                if bound == LOWER_BOUND and score >= beta:
+                    return score
+                if bound == UPPER_BOUND and score <= alpha:
+                    return score
+        if depth <= 0:
+            return evaluate(game_board)
+        moves = self.moves(game_board)
+        if not moves:
+            return -MATE + ply
+        if tt_move in moves:
+            moves.remove(tt_move)
+            moves.insert(0, tt_move)
+        original_alpha, best = alpha, moves[0]
+        for move in moves:
+            record = game_board.make_move(*move)
+            try:
+                score = -self.search(game_board, depth - 1, -beta, -alpha, ply + 1)
+            finally:
+                game_board.unmake_move(record)
+            if score > alpha:
+                alpha, best = score, move
+                if alpha >= beta:
+                    break
+        if alpha >= beta:
+            bound = LOWER_BOUND
+        elif alpha <= original_alpha:
+            bound = UPPER_BOUND
+        else:
+            bound = EXACT
+        self.store(key, depth, to_table(alpha, ply), bound, best)
+        return alpha
+    # Stores a search result, a slot holding a deeper search of another position keeps it
+    def store(self, key, depth, score, bound, move):
+        slot = key & self.table_mask
+        entry = self.table[slot]
+        if entry is None or entry[0] == key or depth >= entry[1]:
+            self.table[slot] = (key, depth, score, bound, move)
+# Engines for the interactive mode arguments after -i
+# -e names the engine player, lower, UPPER or both, and -t its milliseconds per move
+def players(args):
+    names, time_limit = [], 0.1
+    for flag, value in zip(args[0::2], args[1::2]):
+        if flag == '-e':
+            names = ['lower', 'UPPER'] if value == 'both' else [value]
+        elif flag == '-t':
+            time_limit = int(value) / 1000
+    return {name: Engine(time_limit) for name in names}
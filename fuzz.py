@@ -0,0 +1,239 @@
+"""
+Differential fuzzing, plays random test cases on a reference Board and a candidate and compares what they print.
+
+    python3 boxshogi.py -d <reference board.py or directory> [-c <candidate board.py or directory>]
+                        [-n <cases>] [-r <seed>] [-m <most plies>] [-o <failure directory>]
+
+The reference is a self-contained board.py like the original one, whose
+play_file prints and ends the process with sys.exit, and the candidate is
+this tree's board unless -c names another. Both play every case in this
+process, file mode output is caught from standard output or from the out a
+board with play_case writes to, and a case fails when the texts differ or
+only one of them raises.
+
+Cases start from the interactive mode pieces or from a random position
+with both kings. Their moves are random moves Board accepts, sometimes one
+that checks, mixed all through with raw move lines: a piece moved to any
+square, a drop of any letter, a promotion that may not be allowed or a line
+that is not a move at all. Moves are played on a Board as they are picked
+and go on after checks and illegal moves like file mode does, so later
+moves come from the position Board actually reached. Now and then a case
+runs past the MAX_PLIES tie with neither checks nor raw lines. Case k uses
+its own random generator seeded from -r and k, so the same arguments fuzz
+the same cases.
+
+Failing cases are shrunk, moves first and then the pieces besides the kings
+and the captures, as long as they keep failing, and written with -o as
+<failure directory>/fuzz<case>.in along with the reference output in .out.
+The time each side spent on the cases, shrinking aside, and their ratio are
+reported on standard error.
+"""
+import contextlib
+import copy
+import importlib.util
+import io
+import os
+import random
+import sys
+import time
+import board
+import engine
+import gamerecord
+import movegen
+from bitboard import EMPTY, LOWER, NUM_SQUARES, UPPER
+from outcome import MAX_PLIES, render
+
+# Most plies of a case, a long case plays up to the tie and a few plies past it
+DEFAULT_PLIES = 40
+LONG_PLIES = MAX_PLIES + 10
+# Share of long cases, of cases from a random position and, per ply, of checks and raw move lines
+LONG_RATE = 0.05
+RANDOM_POSITION_RATE = 0.5
+CHECK_RATE = 0.1
+RAW_RATE = 0.15
+# Pieces a random position may hold besides the kings, and how many of them
+PIECES = ['s', 'r', 'g', 'n', 'p', '+r', '+g', '+n', '+p']
+MOST_PIECES = 8
+MOST_CAPTURES = 3
+# Moves that are not moves
+JUNK_MOVES = ['move a1 a1', 'drop x a1', 'move a1', 'pass']
+
+# Module of a board.py file, or of the board.py of a directory, under its own name
+def load_board(path):
+    if os.path.isdir(path):
+        path = os.path.join(path, 'board.py')
+    spec = importlib.util.spec_from_file_location('fuzz_board_%d' % len(sys.modules), path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+# Function playing a test case on the Board of module, returns (output, whether it raised)
+# A module with play_case writes to an out, any other prints and may end the game with sys.exit
+def runner(module):
+    def run(case):
+        out = io.StringIO()
+        case = copy.deepcopy(case)
+        try:
+            if hasattr(module, 'play_case'):
+                out.write(render(module.play_case(case, out=out)))
+            else:
+                game_board = module.Board(None, case['moves'], case['initialPieces'], case['upperCaptures'], case['lowerCaptures'], (False, ''), 0, None, None, None)
+                with contextlib.redirect_stdout(out):
+                    try:
+                        game_board.play_file()
+                    except SystemExit:
+                        pass
+        except Exception:
+            return out.getvalue(), True
+        return out.getvalue(), False
+    return run
+
+# Test case of a random position with both kings, no move yet
+def random_position(rng):
+    squares = list(range(NUM_SQUARES))
+    rng.shuffle(squares)
+    pieces = [('d', squares.pop()), ('D', squares.pop())]
+    for _ in range(rng.randint(0, MOST_PIECES)):
+        piece = rng.choice(PIECES)
+        side = rng.choice((LOWER, UPPER))
+        sq = squares.pop()
+        # A Preview cannot stand on the last rank unpromoted
+        if piece == 'p' and sq % 5 == engine.FIRST_RANKS[1 - side]:
+            piece = '+p'
+        pieces.append((piece.upper() if side == UPPER else piece, sq))
+    initial_pieces = [{'piece': piece, 'position': movegen.square_name(sq)} for piece, sq in pieces]
+    upper_captures = [rng.choice('SRGNP') for _ in range(rng.randint(0, MOST_CAPTURES))]
+    lower_captures = [rng.choice('srgnp') for _ in range(rng.randint(0, MOST_CAPTURES))]
+    return dict(initialPieces=initial_pieces, upperCaptures=upper_captures, lowerCaptures=lower_captures, moves=[])
+# Random move line that Board may or may not accept
+def raw_move(game_board, rng):
+    names = [movegen.square_name(sq) for sq in range(NUM_SQUARES)]
+    squares = game_board.bitboard.squares
+    occupied = [name for sq, name in enumerate(names) if squares[sq] != EMPTY]
+    kind = rng.randrange(10)
+    if kind < 5:
+        text = 'move %s %s' % (rng.choice(occupied or names), rng.choice(names))
+        return text + ' promote' if rng.random() < 0.1 else text
+    if kind < 8:
+        return 'drop %s %s' % (rng.choice('srgnp'), rng.choice(names))
+    if kind == 8:
+        side = movegen.side_to_move(game_board)
+        moves = [move for move in movegen.pseudo_moves(game_board, side) if move[0] is not None]
+        if moves:
+            return movegen.format_move(game_board, rng.choice(moves)) + ' promote'
+    return rng.choice(JUNK_MOVES)
+# Whether move of side checks the other king
+def gives_check(game_board, move, side):
+    record = game_board.make_move(*move)
+    attacked = movegen.king_attacked(game_board, 1 - side)
+    game_board.unmake_move(record)
+    return attacked
+# Random test case of up to most_plies moves unless it is a long one
+def random_case(rng, most_plies=DEFAULT_PLIES):
+    long_case = rng.random() < LONG_RATE
+    case = random_position(rng) if rng.random() < RANDOM_POSITION_RATE else None
+    if case is None:
+        start = board.start_board()
+        case = dict(initialPieces=start.initial_state, upperCaptures=[], lowerCaptures=[], moves=[])
+    game_board = board.case_board(dict(case, moves=[]), out=io.StringIO())
+    moves = case['moves']
+    # OVER: Board ended the game or raised, the moves after it are never played
+    over = False
+    for _ in range(LONG_PLIES if long_case else rng.randint(0, most_plies)):
+        side = movegen.side_to_move(game_board)
+        playable = engine.playable_moves(game_board) if not over else []
+        if not playable or (not long_case and rng.random() < RAW_RATE):
+            text = raw_move(game_board, rng)
+        else:
+            rng.shuffle(playable)
+            if long_case or rng.random() >= CHECK_RATE:
+                move = next((move for move in playable if not gives_check(game_board, move, side)), playable[0])
+            else:
+                move = playable[0]
+            text = movegen.format_move(game_board, move)
+        moves.append(text)
+        if not over:
+            try:
+                game_board.shogi_main(text)
+            except Exception:
+                over = True
+    return case
+
+# Items left of a list after taking out every chunk fails still holds without, largest chunks first
+def shrink_list(items, fails):
+    chunk = len(items) // 2
+    while chunk >= 1:
+        start = 0
+        while start < len(items):
+            smaller = items[:start] + items[start + chunk:]
+            if fails(smaller):
+                items = smaller
+            else:
+                start += chunk
+        chunk //= 2
+    return items
+# Smallest case found that still fails
+def shrink(case, fails):
+    kings = [piece for piece in case['initialPieces'] if piece['piece'] in movegen.KINGS]
+    changed = True
+    while changed:
+        changed = False
+        for field in ('moves', 'initialPieces', 'upperCaptures', 'lowerCaptures'):
+            items = case[field]
+            if field == 'initialPieces':
+                items = [piece for piece in items if piece not in kings]
+                smaller = shrink_list(items, lambda pieces: fails(dict(case, initialPieces=kings + pieces)))
+                smaller_case = dict(case, initialPieces=kings + smaller)
+            else:
+                smaller = shrink_list(items, lambda items: fails(dict(case, **{field: items})))
+                smaller_case = dict(case, **{field: smaller})
+            if len(smaller) < len(items):
+                case, changed = smaller_case, True
+    return case
+# Number and text of the first line two outputs differ on
+def first_difference(expected, got):
+    expected_lines, got_lines = expected.split('\n'), got.split('\n')
+    for number, (expected_line, got_line) in enumerate(zip(expected_lines, got_lines)):
+        if expected_line != got_line:
+            return number + 1, expected_line, got_line
+    number = min(len(expected_lines), len(got_lines))
+    return number + 1, '\n'.join(expected_lines[number:number + 1]), '\n'.join(got_lines[number:number + 1])
+
+# Plays n random cases on reference and candidate, runner() functions, and shrinks the ones that fail
+# Returns (failures as (index, shrunk case, reference result, candidate result), reference seconds, candidate seconds)
+def fuzz(reference, candidate, n, seed=0, most_plies=DEFAULT_PLIES):
+    failures = []
+    seconds = [0.0, 0.0]
+    def fails(case):
+        return reference(case) != candidate(case)
+    for index in range(n):
+        case = random_case(random.Random('%d-%d' % (seed, index)), most_plies)
+        start = time.perf_counter()
+        expected = reference(case)
+        middle = time.perf_counter()
+        got = candidate(case)
+        seconds[0] += middle - start
+        seconds[1] += time.perf_counter() - middle
+        if expected != got:
+            case = shrink(case, fails)
+            failures.append((index, case, reference(case), candidate(case)))
+    return failures, seconds[0], seconds[1]
+# Command line for differential fuzzing, args are the arguments after -d
+def main(args):
+    options = dict(zip(args[1::2], args[2::2]))
+    reference = runner(load_board(args[0]))
+    candidate = runner(load_board(options['-c']) if '-c' in options else board)
+    n = int(options.get('-n', 1000))
+    failures, reference_seconds, candidate_seconds = fuzz(reference, candidate, n, int(options.get('-r', 0)), int(options.get('-m', DEFAULT_PLIES)))
+    for index, case, (expected, expected_raised), (got, got_raised) in failures:
+        line, expected_line, got_line = first_difference(expected, got)
+        print('case %d: %d moves, line %d: reference %r%s, candidate %r%s' % (index, len(case['moves']), line, expected_line, ' (raised)' if expected_raised else '', got_line, ' (raised)' if got_raised else ''), file=sys.stderr)
+        if '-o' in options:
+            os.makedirs(options['-o'], exist_ok=True)
+            name = os.path.join(options['-o'], 'fuzz%06d' % index)
+            # A case file ends with its last move, parseTestCase reads a blank line after it as a move
+            with open(name + '.in', 'w') as f:
+                f.write(gamerecord.case_text(case)[:-1])
+            with open(name + '.out', 'w') as f:
+                f.write(expected)
+    ratio = reference_seconds / candidate_seconds if candidate_seconds else 0.0
+    print('%d cases, %d failures, reference %.2f s, candidate %.2f s (%.1fx)' % (n, len(failures), reference_seconds, candidate_seconds, ratio), file=sys.stderr)
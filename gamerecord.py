@@ -0,0 +1,196 @@
+"""
+Binary game records, a compact file of many test cases with random access.
+
+    python3 boxshogi.py -g encode <test case file or -> <record file>
+    python3 boxshogi.py -g decode <record file> [test case file]
+    python3 boxshogi.py -g show <record file> <game number>
+
+File layout, integers little endian:
+
+    header   b'BSGR', version (1 byte), game count (4 bytes), index offset (8 bytes)
+    games    one after the other
+    index    offset of every game and of the end of the last one (8 bytes each)
+
+A game is its pieces (count, then label and square byte pairs, or the one
+byte START_PIECES for the interactive mode starting pieces), the UPPER
+and lower capture hands (count, then label bytes) and its moves (2 byte
+count, then the moves). A drop of a lower case piece letter is one byte, a
+move is two, and anything else the text format allows is kept as its text.
+Converting text to binary and back gives the same test cases.
+"""
+import mmap
+import struct
+import sys
+import board
+from bitboard import NUM_SQUARES
+from movegen import parse_square, square_name
+from utils import iterTestCases
+
+MAGIC = b'BSGR'
+VERSION = 1
+HEADER = struct.Struct('<4sBIQ')
+OFFSET = struct.Struct('<Q')
+COUNT = struct.Struct('<H')
+# Piece labels on the board and in capture hands, by their byte
+LABELS = [prefix + letter for letter in 'dsrgnpDSRGNP' for prefix in ('', '+')]
+LABEL_CODES = {label: code for code, label in enumerate(LABELS)}
+DROP_LETTERS = 'dsrgnp'
+# Piece count byte of a game starting from the pieces of interactive mode, in their order
+START_PIECES = 0xFF
+START_STATE = board.start_board().initial_state
+# MOVE CODES: First byte of a move
+# 0 up to DROP_END: Drop of DROP_LETTERS[code // 25] on square code % 25, one byte
+# MOVE_START up to TEXT: Move, (start * 25 + end) * 2 + promote over two bytes
+# TEXT: Move kept as text, a length byte and the text follow
+DROP_END = len(DROP_LETTERS) * NUM_SQUARES
+MOVE_START = DROP_END
+TEXT = 0xFF
+
+# Bytes of a move like 'move a1 b2 promote' or 'drop p c3'
+def encode_move(text):
+    fields = text.split(' ')
+    try:
+        if fields[0] == 'drop' and len(fields) == 3 and fields[1] in DROP_LETTERS:
+            return bytes([DROP_LETTERS.index(fields[1]) * NUM_SQUARES + parse_square(fields[2])])
+        if fields[0] == 'move' and (len(fields) == 3 or len(fields) == 4 and fields[3] == 'promote'):
+            code = (parse_square(fields[1]) * NUM_SQUARES + parse_square(fields[2])) * 2 + (len(fields) == 4)
+            return bytes([MOVE_START + (code >> 8), code & 0xFF])
+    # CASE: A square that is not on the board, kept as text
+    except ValueError:
+        pass
+    raw = text.encode()
+    if len(raw) > 0xFF:
+        raise ValueError('Move too long for a game record: %r' % text)
+    return bytes([TEXT, len(raw)]) + raw
+# Move text of the move at offset in data, returns (text, offset after it)
+def decode_move(data, offset):
+    code = data[offset]
+    if code < DROP_END:
+        letter, sq = divmod(code, NUM_SQUARES)
+        return 'drop ' + DROP_LETTERS[letter] + ' ' + square_name(sq), offset + 1
+    if code == TEXT:
+        length = data[offset + 1]
+        return bytes(data[offset + 2:offset + 2 + length]).decode(), offset + 2 + length
+    code = (code - MOVE_START) << 8 | data[offset + 1]
+    squares, promote = divmod(code, 2)
+    start, end = divmod(squares, NUM_SQUARES)
+    text = 'move ' + square_name(start) + ' ' + square_name(end)
+    return text + ' promote' if promote else text, offset + 2
+# Bytes of a test case like utils.parseTestCase returns
+def encode_game(case):
+    pieces = case['initialPieces']
+    if pieces == START_STATE:
+        data = bytearray([START_PIECES])
+    else:
+        data = bytearray([len(pieces)])
+        for piece in pieces:
+            data += bytes([LABEL_CODES[piece['piece']], parse_square(piece['position'])])
+    for hand in (case['upperCaptures'], case['lowerCaptures']):
+        data.append(len(hand))
+        data += bytes(LABEL_CODES[piece] for piece in hand)
+    data += COUNT.pack(len(case['moves']))
+    for move in case['moves']:
+        data += encode_move(move)
+    return bytes(data)
+# Test case like utils.parseTestCase returns from the game at offset in data
+def decode_game(data, offset=0):
+    count = data[offset]
+    offset += 1
+    if count == START_PIECES:
+        pieces = [dict(piece) for piece in START_STATE]
+    else:
+        pieces = []
+        for _ in range(count):
+            pieces.append(dict(piece=LABELS[data[offset]], position=square_name(data[offset + 1])))
+            offset += 2
+    hands = []
+    for _ in range(2):
+        count = data[offset]
+        hands.append([LABELS[code] for code in data[offset + 1:offset + 1 + count]])
+        offset += 1 + count
+    count, = COUNT.unpack_from(data, offset)
+    offset += COUNT.size
+    moves = []
+    for _ in range(count):
+        move, offset = decode_move(data, offset)
+        moves.append(move)
+    return dict(initialPieces=pieces, upperCaptures=hands[0], lowerCaptures=hands[1], moves=moves)
+
+# Writes test cases to a record file, returns the number of games written
+def write_records(path, cases):
+    offsets = []
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, 0, 0))
+        for case in cases:
+            offsets.append(f.tell())
+            f.write(encode_game(case))
+        offsets.append(f.tell())
+        for offset in offsets:
+            f.write(OFFSET.pack(offset))
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, VERSION, len(offsets) - 1, offsets[-1]))
+    return len(offsets) - 1
+
+class GameRecords:
+    """
+    Class that reads games from a record file by number without reading the games before them
+    """
+    def __init__(self, path):
+        self._file = open(path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.count, self.index = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError('Not a version %d game record file: %s' % (VERSION, path))
+    def __len__(self):
+        return self.count
+    # Test case of game k, counting from 0
+    def __getitem__(self, k):
+        if not 0 <= k < self.count:
+            raise IndexError('Game %d of %d' % (k, self.count))
+        offset, = OFFSET.unpack_from(self._map, self.index + k * OFFSET.size)
+        return decode_game(self._map, offset)
+    def __iter__(self):
+        for k in range(self.count):
+            yield self[k]
+    def close(self):
+        self._map.close()
+        self._file.close()
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc_info):
+        self.close()
+
+# Text of a test case in the format utils.iterTestCases reads, ending with the blank line after its moves
+def case_text(case):
+    lines = [piece['piece'] + ' ' + piece['position'] for piece in case['initialPieces']]
+    lines.append('')
+    lines.append('[' + ' '.join(case['upperCaptures']) + ']')
+    lines.append('[' + ' '.join(case['lowerCaptures']) + ']')
+    lines.append('')
+    lines.extend(case['moves'])
+    lines.append('')
+    return '\n'.join(lines) + '\n'
+# Converts a test case file of one or many games to a record file
+def text_to_binary(source, path):
+    return write_records(path, iterTestCases(source))
+# Converts a record file to a test case file, out is an open text file
+def binary_to_text(path, out):
+    with GameRecords(path) as records:
+        for case in records:
+            out.write(case_text(case))
+        return len(records)
+# Command line for game records, args are the arguments after -g
+def main(args):
+    if args[0] == 'encode':
+        games = text_to_binary(args[1], args[2])
+        print('%d games written to %s' % (games, args[2]), file=sys.stderr)
+    elif args[0] == 'decode':
+        if len(args) > 2:
+            with open(args[2], 'w') as out:
+                binary_to_text(args[1], out)
+        else:
+            binary_to_text(args[1], sys.stdout)
+    elif args[0] == 'show':
+        with GameRecords(args[1]) as records:
+            sys.stdout.write(case_text(records[int(args[2])]))
@@ -0,0 +1,92 @@
+"""
+Capture hand of a BoxShogi player, counted per piece.
+
+A hand keeps, for every piece it holds, the capture serials of its copies
+oldest first, so the count of a piece, membership, adding a capture and
+dropping the oldest copy all take constant time. Iterating a hand still
+lists its pieces in the order they were captured, the order of the
+"Captures UPPER:" and "Captures lower:" lines, with a drop taking the
+oldest copy of its piece like list.remove did.
+"""
+from bisect import bisect
+from collections import deque
+
+class Hand:
+    """
+    Class for the pieces one player has captured
+    """
+    # PIECES: Pieces in capture order, like the captures of a test case
+    def __init__(self, pieces=()):
+        # SERIALS: Piece to the serials of its copies in hand, oldest first, a piece leaves it at count 0
+        # NEXT_SERIAL: Serial the next capture gets
+        self.serials = {}
+        self.size = 0
+        self.next_serial = 0
+        self.extend(pieces)
+    def __len__(self):
+        return self.size
+    def __contains__(self, piece):
+        return piece in self.serials
+    # Pieces in capture order
+    def __iter__(self):
+        serials = self.serials
+        if len(serials) == 1:
+            for piece, copies in serials.items():
+                return iter([piece] * len(copies))
+        return iter([piece for _, piece in sorted((serial, piece) for piece, copies in serials.items() for serial in copies)])
+    def __eq__(self, other):
+        if isinstance(other, Hand):
+            other = list(other)
+        return list(self) == other
+    def __repr__(self):
+        return 'Hand(%r)' % list(self)
+    # Copies of piece in hand
+    def count(self, piece):
+        copies = self.serials.get(piece)
+        return len(copies) if copies else 0
+    # Distinct pieces in hand
+    def labels(self):
+        return list(self.serials)
+    # (piece, count) of every distinct piece in hand
+    def items(self):
+        return [(piece, len(copies)) for piece, copies in self.serials.items()]
+    # Adds piece and returns its serial, the newest unless serial puts back a copy remove() took out
+    def add(self, piece, serial=None):
+        copies = self.serials.get(piece)
+        if copies is None:
+            copies = self.serials[piece] = deque()
+        if serial is None:
+            serial = self.next_serial
+            self.next_serial += 1
+            copies.append(serial)
+        elif not copies or serial < copies[0]:
+            copies.appendleft(serial)
+        else:
+            copies.insert(bisect(copies, serial), serial)
+        self.size += 1
+        return serial
+    # Takes out the oldest copy of piece, or the copy with serial, and returns its serial
+    def remove(self, piece, serial=None):
+        copies = self.serials.get(piece)
+        if not copies:
+            raise ValueError('%r not in hand' % piece)
+        if serial is None:
+            serial = copies.popleft()
+        elif serial == copies[-1]:
+            copies.pop()
+        else:
+            copies.remove(serial)
+        if not copies:
+            del self.serials[piece]
+        self.size -= 1
+        return serial
+    # Adds every piece, in order
+    def extend(self, pieces):
+        for piece in pieces:
+            self.add(piece)
+    # Replaces the contents with pieces, in order
+    def replace(self, pieces):
+        self.serials.clear()
+        self.size = 0
+        self.next_serial = 0
+        self.extend(pieces)
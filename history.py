@@ -0,0 +1,42 @@
+"""
+Position history of a game, for repetition detection.
+
+Board pushes the Zobrist key of every position a move reaches and pops it
+when the move is unmade, and a count per key says how often a position has
+occurred in the game so far without walking the history.
+"""
+
+class History:
+    """
+    Class for the stack of position keys of a game and how often each occurred
+    """
+    def __init__(self):
+        # KEYS: Position keys in the order they occurred, the current position last
+        # COUNTS: Position key to how many times it is in KEYS
+        self.keys = []
+        self.counts = {}
+    def __len__(self):
+        return len(self.keys)
+    # Adds the position a move reached
+    def push(self, key):
+        self.keys.append(key)
+        self.counts[key] = self.counts.get(key, 0) + 1
+    # Takes back the last position and returns its key
+    def pop(self):
+        key = self.keys.pop()
+        count = self.counts[key] - 1
+        if count:
+            self.counts[key] = count
+        else:
+            del self.counts[key]
+        return key
+    # Times the position with key occurred
+    def count(self, key):
+        return self.counts.get(key, 0)
+    # Whether the position with key occurred at least times times
+    def occurred(self, key, times):
+        return self.counts.get(key, 0) >= times
+    # Starts over from a single position
+    def reset(self, key):
+        self.keys = [key]
+        self.counts = {key: 1}
@@ -0,0 +1,127 @@
+"""
+Mate solver, finds the shortest forced mate of the player to move.
+
+    python3 boxshogi.py -m <moves> <case file> [-r board|readme] [<tablebase file>]
+
+The case file is set up with its pieces and captures and its moves are
+played, then the player whose turn it is looks for a mate in at most the
+given number of their own moves. The search is a mate-only alpha-beta: the
+attacker only tries moves and drops that give check, the defender tries
+every legal reply, and a line ends in mate when the defender is in check
+with no legal move. Moves follow the board rules of engine.playable by
+default, the rules Board.shogi_main plays by, so a Preview drop giving
+check or any drop while a capture hand is empty is never tried. With -r
+readme they follow the README rules of movegen instead. A tablebase built
+with the same rules ends the search of any position it does not score as
+won within the plies left, a mate giving check every move is a win too.
+"""
+import board
+import engine
+import movegen
+import tablebase
+
+# Moves of the player to move that check the other king, from generate, engine.playable_moves or movegen.legal_moves
+def checking_moves(game_board, generate=engine.playable_moves):
+    side = movegen.side_to_move(game_board)
+    moves = []
+    for move in generate(game_board):
+        record = game_board.make_move(*move)
+        if movegen.king_attacked(game_board, 1 - side):
+            moves.append(move)
+        game_board.unmake_move(record)
+    return moves
+
+class MateSolver:
+    """
+    Class that searches one position for mates, results are kept between depths
+    """
+    # TABLEBASES: tablebase.Tablebases built with the same rules, or None
+    # RULES: tablebase.BOARD_RULES or tablebase.README_RULES, the moves both players may play
+    def __init__(self, game_board, tablebases=None, rules=tablebase.BOARD_RULES):
+        if tablebases is not None and tablebases.rules != rules:
+            raise ValueError('The mate solver needs a tablebase built with the rules it plays by')
+        self.game_board = game_board
+        self.tablebases = tablebases
+        self.generate = tablebase.RULE_MOVES[rules]
+        # PROVEN: (position key, plies) to the mating line from that position, None when there is none
+        self.proven = {}
+        self.nodes = 0
+    # Shortest mate in at most max_moves attacker moves, the list of moves or None
+    def solve(self, max_moves):
+        for moves in range(1, max_moves + 1):
+            line = self.attack(2 * moves - 1)
+            if line is not None:
+                return line
+        return None
+    # Line mating within plies for the player to move, who gives check every move
+    def attack(self, plies):
+        game_board = self.game_board
+        key = (game_board.position_key(), plies)
+        if key in self.proven:
+            return self.proven[key]
+        self.nodes += 1
+        line = None
+        found = self.tablebases.probe(game_board) if self.tablebases is not None else None
+        if found is not None and not (found[0] == tablebase.WIN and found[1] <= plies):
+            self.proven[key] = line
+            return line
+        for move in checking_moves(game_board, self.generate):
+            record = game_board.make_move(*move)
+            reply = self.defend(plies - 1)
+            game_board.unmake_move(record)
+            if reply is not None:
+                line = [move] + reply
+                break
+        self.proven[key] = line
+        return line
+    # Longest line the player to move, in check, can hold out with, None if one escapes
+    def defend(self, plies):
+        game_board = self.game_board
+        self.nodes += 1
+        moves = self.generate(game_board)
+        if not moves:
+            return []
+        if plies == 0:
+            return None
+        longest = None
+        for move in moves:
+            record = game_board.make_move(*move)
+            line = self.attack(plies - 1)
+            game_board.unmake_move(record)
+            if line is None:
+                return None
+            if longest is None or len(line) + 1 > len(longest):
+                longest = [move] + line
+        return longest
+
+# Shortest mate on game_board in at most max_moves moves of the player to move, None if there is none
+def solve(game_board, max_moves, tablebases=None, rules=tablebase.BOARD_RULES):
+    return MateSolver(game_board, tablebases, rules).solve(max_moves)
+# Texts of a line of moves played from game_board, like the moves of a test case file
+def line_text(game_board, line):
+    texts, records = [], []
+    for move in line:
+        texts.append(movegen.format_move(game_board, move))
+        records.append(game_board.make_move(*move))
+    for record in reversed(records):
+        game_board.unmake_move(record)
+    return texts
+# Command line for the mate solver, args are the arguments after -m
+def main(args):
+    max_moves = int(args[0])
+    game_board = board.case_position(args[1])
+    rest = args[2:]
+    rules = tablebase.BOARD_RULES
+    if rest[:1] == ['-r']:
+        rules, rest = tablebase.RULE_NAMES[rest[1]], rest[2:]
+    if rest:
+        with tablebase.Tablebases(rest[0]) as tablebases:
+            line = solve(game_board, max_moves, tablebases, rules)
+    else:
+        line = solve(game_board, max_moves, rules=rules)
+    if line is None:
+        print('No mate in %d' % max_moves)
+        return
+    print('Mate in %d' % ((len(line) + 1) // 2))
+    for text in line_text(game_board, line):
+        print(text)
@@ -0,0 +1,216 @@
+"""
+Monte Carlo tree search player, an alternative to the alpha-beta engine.Engine.
+
+Every playout walks down the tree choosing children by UCT, adds the
+children of the leaf it stops at and scores the leaf with a rollout, a game
+of random moves played from it. Playouts run in batches: the walk of every
+playout of a batch counts as a visit straight away, so the next walk of the
+batch prefers other lines, and the rollouts of the batch are played together
+on a process pool before their results are backed up.
+
+Nodes are numbers into flat arrays rather than objects, and the children of a
+node are numbered one after the other, so a node is its first child and
+child count. A node's wins are counted for the player whose move led to it,
+a rollout cut off after ROLLOUT_PLIES is scored from engine.evaluate. Moves
+follow engine.playable, the rules Board.shogi_main plays by.
+"""
+import math
+import random
+import time
+from array import array
+from multiprocessing import Pool
+import board
+import engine
+import movegen
+from bitboard import UPPER
+
+# UCT exploration constant
+EXPLORATION = 1.4
+# Playouts whose rollouts are played together
+BATCH_SIZE = 8
+# Plies of a rollout at most before the position is scored
+ROLLOUT_PLIES = 40
+# engine.evaluate score of a cut off rollout that counts as about three quarters of a win
+SCORE_SCALE = 50
+# First child of a node whose children were not added yet, and of one with no moves
+UNEXPANDED = -1
+TERMINAL = -2
+
+# Score of a rollout from game_board for UPPER, 1 for a win, 0 for a loss
+# The moves are unmade again, so game_board ends where it started
+def play_rollout(game_board, rng, plies):
+    records = []
+    try:
+        for _ in range(plies):
+            move = engine.random_move(game_board, rng)
+            if move is None:
+                return 0.0 if movegen.side_to_move(game_board) == UPPER else 1.0
+            records.append(game_board.make_move(*move))
+        score = engine.evaluate(game_board)
+        if movegen.side_to_move(game_board) != UPPER:
+            score = -score
+        return 0.5 + 0.5 * math.tanh(score / SCORE_SCALE)
+    finally:
+        for record in reversed(records):
+            game_board.unmake_move(record)
+# Rollout on a worker process, task is (position, seed, plies)
+def rollout(task):
+    state, seed, plies = task
+    return play_rollout(board.position_board(state), random.Random(seed), plies)
+
+class MCTS:
+    """
+    Class that picks moves for one player with Monte Carlo tree search
+    """
+    # TIME_LIMIT: Seconds to spend on a move, None for no limit
+    # PLAYOUTS: Playouts per move, None for no limit, one of the two limits is needed
+    # PROCESSES: Processes playing rollouts, 1 plays them in this process
+    # SEED: Seed of the random generator rollouts are seeded from
+    # BOOK: book.Book whose most played move is played without a search while it has the position
+    def __init__(self, time_limit=1.0, playouts=None, processes=1, batch_size=BATCH_SIZE, exploration=EXPLORATION, rollout_plies=ROLLOUT_PLIES, seed=0, book=None):
+        if time_limit is None and playouts is None:
+            raise ValueError('MCTS needs a time limit or a number of playouts')
+        self.time_limit = time_limit
+        self.playouts = playouts
+        self.batch_size = batch_size
+        self.exploration = exploration
+        self.rollout_plies = rollout_plies
+        self.rng = random.Random(seed)
+        self.book = book
+        self.pool = Pool(processes) if processes > 1 else None
+        self.nodes = 0
+        # _TASKS: Rollouts of the batch being selected that a worker plays
+        self._tasks = []
+        self._clear()
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc_info):
+        self.close()
+    # Stops the rollout processes
+    def close(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool = None
+    # Empties the tree
+    # MOVES: Code of the move that led to every node
+    # FIRST_CHILD, CHILD_COUNT: Children of every node, FIRST_CHILD is UNEXPANDED or TERMINAL without any
+    # VISITS, WINS: Playouts through every node and their score for the player who moved into it
+    def _clear(self):
+        self.moves = array('l')
+        self.first_child = array('l')
+        self.child_count = array('l')
+        self.visits = array('l')
+        self.wins = array('d')
+    def _add_node(self, code):
+        self.moves.append(code)
+        self.first_child.append(UNEXPANDED)
+        self.child_count.append(0)
+        self.visits.append(0)
+        self.wins.append(0.0)
+        return len(self.moves) - 1
+    # Adds a child for every move of the player to move, returns False when there is none
+    def _expand(self, node, game_board):
+        moves = engine.playable_moves(game_board)
+        if not moves:
+            self.first_child[node] = TERMINAL
+            return False
+        self.first_child[node] = len(self.moves)
+        self.child_count[node] = len(moves)
+        for move in moves:
+            self._add_node(movegen.encode_move(move))
+        return True
+    # Child of node with the best UCT value, the first one not visited yet if any
+    def _best_child(self, node):
+        visits, wins = self.visits, self.wins
+        first = self.first_child[node]
+        log_visits = math.log(visits[node])
+        best, best_value = first, -1.0
+        for child in range(first, first + self.child_count[node]):
+            child_visits = visits[child]
+            if child_visits == 0:
+                return child
+            value = wins[child] / child_visits + self.exploration * math.sqrt(log_visits / child_visits)
+            if value > best_value:
+                best, best_value = child, value
+        return best
+    # Walks from the root to a leaf, visiting every node on the way
+    # Returns the (node, player who moved into it) path and the leaf's score for UPPER, None when it needs a rollout
+    def _select(self, game_board):
+        node, path, records = 0, [], []
+        self.visits[0] += 1
+        try:
+            while True:
+                first = self.first_child[node]
+                if first == TERMINAL:
+                    return path, 0.0 if movegen.side_to_move(game_board) == UPPER else 1.0
+                # A leaf gets its children the second time a playout reaches it
+                if first == UNEXPANDED:
+                    if self.visits[node] == 1:
+                        return path, self._leaf_score(game_board)
+                    if not self._expand(node, game_board):
+                        continue
+                child = self._best_child(node)
+                path.append((child, movegen.side_to_move(game_board)))
+                records.append(game_board.make_move(*movegen.decode_move(self.moves[child])))
+                self.visits[child] += 1
+                node = child
+        finally:
+            for record in reversed(records):
+                game_board.unmake_move(record)
+    # Score of a leaf played in this process, None when a worker plays it
+    def _leaf_score(self, game_board):
+        if self.pool is not None:
+            self._tasks.append((board.position(game_board), self.rng.getrandbits(32), self.rollout_plies))
+            return None
+        return play_rollout(game_board, random.Random(self.rng.getrandbits(32)), self.rollout_plies)
+    # Plays count playouts, the rollouts of all of them together
+    def _run_batch(self, game_board, count):
+        self._tasks = []
+        playouts = [self._select(game_board) for _ in range(count)]
+        results = iter(self.pool.map(rollout, self._tasks)) if self._tasks else iter(())
+        for path, score in playouts:
+            if score is None:
+                score = next(results)
+            for node, mover in path:
+                self.wins[node] += score if mover == UPPER else 1.0 - score
+    # Move tuple for the player whose turn it is on game_board, None if they have none
+    def choose(self, game_board):
+        if self.book is not None:
+            move = self.book.choose(game_board)
+            if move is not None:
+                self.nodes = 0
+                return move
+        self._clear()
+        root = self._add_node(0)
+        self.visits[root] = 1
+        if not self._expand(root, game_board):
+            return None
+        if self.child_count[root] > 1:
+            deadline = time.perf_counter() + self.time_limit if self.time_limit is not None else None
+            played = 0
+            while self.playouts is None or played < self.playouts:
+                if deadline is not None and time.perf_counter() > deadline:
+                    break
+                count = self.batch_size if self.playouts is None else min(self.batch_size, self.playouts - played)
+                self._run_batch(game_board, count)
+                played += count
+        self.nodes = len(self.moves)
+        first = self.first_child[root]
+        children = range(first, first + self.child_count[root])
+        return movegen.decode_move(self.moves[max(children, key=lambda child: self.visits[child])])
+    # Text of the move to play, like the moves of a test case file
+    def choose_text(self, game_board):
+        move = self.choose(game_board)
+        return None if move is None else movegen.format_move(game_board, move)
+# Players for the interactive mode arguments after -i -a mcts
+# -e names the player, lower, UPPER or both, -t its milliseconds per move and -w its rollout processes
+def players(args):
+    names, time_limit, processes = [], 1.0, 1
+    for flag, value in zip(args[0::2], args[1::2]):
+        if flag == '-e':
+            names = ['lower', 'UPPER'] if value == 'both' else [value]
+        elif flag == '-t':
+            time_limit = int(value) / 1000
+        elif flag == '-w':
+            processes = int(value)
+    return {name: MCTS(time_limit, processes=processes) for name in names}
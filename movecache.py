@@ -0,0 +1,50 @@
+"""
+Size-bounded cache of legal move lists keyed by Board.position_key().
+
+The key covers the pieces on their squares, the count of every piece in both
+capture hands and the player to move, everything the legal moves of a
+position depend on, so a capture or drop that changes a hand gives a new key
+and nothing has to be invalidated by hand. When the cache is full the
+position used least recently is dropped.
+"""
+from collections import OrderedDict
+import movegen
+
+class MoveCache:
+    """
+    Class that keeps the moves generate returned for the positions used most recently
+    """
+    # GENERATE: Function from a board to its list of moves, movegen.legal_moves by default
+    # MAXSIZE: Most positions kept
+    def __init__(self, generate=movegen.legal_moves, maxsize=65536):
+        self.generate = generate
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+    def __len__(self):
+        return len(self.entries)
+    # Moves of the player to move on game_board, a new list the caller may change
+    def moves(self, game_board):
+        key = game_board.position_key()
+        entries = self.entries
+        moves = entries.get(key)
+        if moves is not None:
+            self.hits += 1
+            entries.move_to_end(key)
+            return list(moves)
+        self.misses += 1
+        moves = self.generate(game_board)
+        entries[key] = tuple(moves)
+        if len(entries) > self.maxsize:
+            entries.popitem(last=False)
+        return list(moves)
+    # Forgets every position and resets the counters
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+    # Share of lookups answered from the cache
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
@@ -0,0 +1,162 @@
+"""
+Legal move and drop generation for Board, following the rules in README.md.
+
+A move is a (start, end, piece) tuple that Board.make_move() takes as is:
+start and end are bitboard squares, start is None for a drop, and piece is
+the label placed on end, promoted when the move promotes and the hand letter
+for a drop.
+"""
+from bitboard import LOWER, NUM_SQUARES, PREVIEWS, UPPER, EMPTY, ZONE_MASKS, coordinates, square, squares_of
+from attacks import NO_ATTACKS, NO_RAYS, RAYS, STEP_MASKS
+from zobrist import LABELS
+
+# Pieces that can be promoted
+PROMOTABLE = frozenset(['r', 'g', 'n', 'p', 'R', 'G', 'N', 'P'])
+KINGS = ('d', 'D')
+# Moves as integers below 2 ** 16: start square, DROP for a drop, end square and piece label
+DROP = NUM_SQUARES
+LABEL_CODES = {label: code for code, label in enumerate(LABELS)}
+
+# Player whose turn it is, lower moves on even turns
+def side_to_move(board):
+    return UPPER if board.turn % 2 == 1 else LOWER
+# Capture hand of a player
+def hand_of(board, side):
+    return board.upper_cap if side == UPPER else board.lower_cap
+# Whether a slider on sq reaches target without jumping over a piece
+def slider_reaches(squares, piece, sq, target):
+    for _, _, ray in RAYS[piece][sq]:
+        for _, ray_square in ray:
+            if ray_square == target:
+                return True
+            if squares[ray_square] != EMPTY:
+                break
+    return False
+# Whether the king of side can be captured by the other player
+# The attack maps answer most positions, only the attackers they list are walked
+def king_attacked(board, side):
+    bitboard = board.bitboard
+    king_square = bitboard.find(KINGS[side])
+    if king_square is None or not bitboard.attacked(1 - side, king_square):
+        return False
+    squares = bitboard.squares
+    for attacker in bitboard.attackers(1 - side, king_square):
+        piece = squares[attacker]
+        if STEP_MASKS.get(piece, NO_ATTACKS)[attacker] >> king_square & 1:
+            return True
+        if piece in RAYS and slider_reaches(squares, piece, attacker, king_square):
+            return True
+    return False
+# Mask of squares a piece on sq can move to, own pieces excluded
+def target_mask(squares, piece, sq, own):
+    mask = STEP_MASKS.get(piece, NO_ATTACKS)[sq] & ~own
+    for _, _, ray in RAYS.get(piece, NO_RAYS)[sq]:
+        for _, ray_square in ray:
+            if own >> ray_square & 1:
+                break
+            mask |= 1 << ray_square
+            if squares[ray_square] != EMPTY:
+                break
+    return mask
+# Files holding an unpromoted Preview of side, kept up to date by the bitboard
+def preview_files(board, side):
+    return board.bitboard.preview_files[side]
+# Squares side may drop piece on, empty squares minus the Preview rules except immediate mate
+def drop_mask(board, side, piece):
+    return board.bitboard.drop_mask(side, piece)
+# Every move and drop of side that follows the piece rules, before checking its own king
+def pseudo_moves(board, side):
+    moves = []
+    bitboard = board.bitboard
+    squares = bitboard.squares
+    own = bitboard.occupied[side]
+    zone = ZONE_MASKS[side]
+    for sq in squares_of(own):
+        piece = squares[sq]
+        promotable = piece in PROMOTABLE
+        for target in squares_of(target_mask(squares, piece, sq, own)):
+            if promotable and (zone >> sq & 1 or zone >> target & 1):
+                moves.append((sq, target, '+' + piece))
+                # CASE: Forced preview promotion
+                if piece in PREVIEWS and zone >> target & 1:
+                    continue
+            moves.append((sq, target, piece))
+    upper = side == UPPER
+    for piece in sorted(hand_of(board, side).labels()):
+        if piece.isupper() != upper:
+            continue
+        for target in squares_of(drop_mask(board, side, piece)):
+            moves.append((None, target, piece))
+    return moves
+# Whether side has any move or drop that does not leave its king in check
+def has_legal_move(board, side):
+    for move in pseudo_moves(board, side):
+        record = board.make_move(*move)
+        safe = not king_attacked(board, side)
+        board.unmake_move(record)
+        if safe:
+            return True
+    return False
+# Every legal move and drop of the player whose turn it is
+def legal_moves(board):
+    side = side_to_move(board)
+    moves = []
+    for move in pseudo_moves(board, side):
+        record = board.make_move(*move)
+        legal = not king_attacked(board, side)
+        # CASE: Preview dropped immediately causing mate
+        if legal and move[0] is None and move[2] in PREVIEWS and king_attacked(board, 1 - side):
+            legal = has_legal_move(board, 1 - side)
+        board.unmake_move(record)
+        if legal:
+            moves.append(move)
+    return moves
+# Whether the player whose turn it is is in check
+def in_check(board):
+    return king_attacked(board, side_to_move(board))
+# Square of a position like a1, ValueError when it is not on the board
+def parse_square(position):
+    if len(position) != 2 or not 'a' <= position[0] <= 'e' or not '1' <= position[1] <= '5':
+        raise ValueError('Not a square: ' + position)
+    return square(ord(position[0]) - ord('a'), int(position[1]) - 1)
+# Position like a1 of a square
+def square_name(sq):
+    row, col = coordinates(sq)
+    return chr(ord('a') + row) + str(col + 1)
+# Move tuple of a move like 'move a1 b2 promote' or 'drop p c3' for the player whose turn it is
+def parse_move(board, text):
+    move_info = text.split()
+    if len(move_info) == 3 and move_info[0] == 'drop':
+        piece = move_info[1].upper() if side_to_move(board) == UPPER else move_info[1].lower()
+        return None, parse_square(move_info[2]), piece
+    if len(move_info) in (3, 4) and move_info[0] == 'move' and move_info[3:] in ([], ['promote']):
+        start, end = parse_square(move_info[1]), parse_square(move_info[2])
+        piece = board.bitboard.squares[start]
+        if piece == EMPTY:
+            raise ValueError('No piece on ' + move_info[1])
+        # CASE: Normal promotion
+        # CASE: Forced preview promotion
+        if len(move_info) == 4 or (piece in PREVIEWS and ZONE_MASKS[side_to_move(board)] >> end & 1):
+            if piece not in PROMOTABLE:
+                raise ValueError('Cannot promote ' + piece)
+            piece = '+' + piece
+        return start, end, piece
+    raise ValueError('Not a move: ' + text)
+# Text of a move tuple, like the moves of a test case file, before it is made on board
+def format_move(board, move):
+    start, end, piece = move
+    if start is None:
+        return 'drop ' + piece.lower() + ' ' + square_name(end)
+    text = 'move ' + square_name(start) + ' ' + square_name(end)
+    if piece != board.bitboard.squares[start]:
+        text += ' promote'
+    return text
+# Integer code of a move tuple
+def encode_move(move):
+    start, end, piece = move
+    return ((DROP if start is None else start) * NUM_SQUARES + end) * len(LABELS) + LABEL_CODES[piece]
+# Move tuple of an integer code
+def decode_move(code):
+    squares, label = divmod(code, len(LABELS))
+    start, end = divmod(squares, NUM_SQUARES)
+    return (None if start == DROP else start, end, LABELS[label])
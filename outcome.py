@@ -0,0 +1,47 @@
+"""
+Structured results of a BoxShogi game, for playing games without exiting the process.
+"""
+from collections import namedtuple
+
+# REASON: Why the game stopped
+CHECKMATE = 'Checkmate'
+ILLEGAL_MOVE = 'Illegal move'
+TOO_MANY_MOVES = 'Too many moves'
+# A position occurred as often as the repetition rule of the board allows
+REPETITION = 'Repetition'
+# A player is in check and the game stops to list their moves out of check
+CHECK = 'Check'
+# Plies of a game before it ends in a tie, TOO_MANY_MOVES
+MAX_PLIES = 400
+
+# WINNER: 'UPPER', 'lower' or None when nobody won
+# REASON: One of the reasons above, None when the moves ran out and the game goes on
+# IN_CHECK: Player named by the "is in check!" line, None when nobody is in check
+# NEXT_PLAYER: Player whose prompt comes next, None when the game is over
+# ESCAPE_MOVES: Moves out of check like 'drop p c3' or 'move a1 b2', in output order
+# BOARD: Final board as a list of lists like Board._board
+# UPPER_CAP, LOWER_CAP: Final capture hands
+# TURN: Moves played
+Outcome = namedtuple('Outcome', ['winner', 'reason', 'in_check', 'next_player', 'escape_moves', 'board', 'upper_cap', 'lower_cap', 'turn'])
+
+class GameOver(Exception):
+    """
+    Raised inside Board when a game ends, carries the Outcome
+    """
+    def __init__(self, outcome):
+        super().__init__(outcome.reason)
+        self.outcome = outcome
+
+# Text printed for an outcome after the last board, the same text file and interactive mode print
+def render(outcome):
+    if outcome.reason is None:
+        return ''
+    if outcome.reason == CHECK:
+        lines = [outcome.in_check + ' player is in check!', 'Available moves:']
+        lines.extend(outcome.escape_moves)
+        lines.append(outcome.next_player + '>')
+    elif outcome.reason in (TOO_MANY_MOVES, REPETITION):
+        lines = ['Tie game.  ' + outcome.reason + '.']
+    else:
+        lines = [outcome.winner + ' player wins.  ' + outcome.reason + '.']
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,120 @@
+"""
+Perft, counts the legal move and drop sequences from a position to check and time move generation.
+
+    python3 boxshogi.py -p <depth> [case file] [-c] [-r board|readme] [-x]
+
+Moves follow the board rules of engine.playable by default, the rules
+Board.shogi_main plays by, or the README rules of movegen with -r readme.
+Without a case file the count starts from the interactive mode starting
+position and is compared against EXPECTED. A case file is set up with its
+pieces and captures and its moves are played before counting. -x also plays
+every counted move through Board.shogi_main on a board of its own and lists
+the ones it refuses or plays differently from make_move.
+"""
+import io
+import sys
+import time
+import board
+import engine
+import movegen
+from movecache import MoveCache
+from outcome import GameOver
+
+# Move generators of the rules, the same rule sets as tablebase.RULE_NAMES
+RULES = {'board': engine.playable_moves, 'readme': movegen.legal_moves}
+# Node counts from depth 0 up for the starting position of interactive mode, under each rules
+EXPECTED = {
+    'board': {'start': [1, 14, 181, 2511, 34311, 497264]},
+    'readme': {'start': [1, 14, 181, 2512, 35401, 533203]},
+}
+
+# Number of move and drop sequences of length depth from game_board
+# Cache is a MoveCache the moves are looked up in, None to generate them every time with generate
+def perft(game_board, depth, cache=None, generate=engine.playable_moves):
+    if depth == 0:
+        return 1
+    moves = cache.moves(game_board) if cache is not None else generate(game_board)
+    if depth == 1:
+        return len(moves)
+    nodes = 0
+    for move in moves:
+        record = game_board.make_move(*move)
+        nodes += perft(game_board, depth - 1, cache, generate)
+        game_board.unmake_move(record)
+    return nodes
+# Whether Board.shogi_main plays move on game_board without calling it illegal and reaches the position make_move does
+def shogi_main_accepts(game_board, move):
+    played = board.position_board(board.position(game_board), out=io.StringIO())
+    try:
+        played.shogi_main(movegen.format_move(game_board, move))
+    except GameOver:
+        return False
+    if played.illegal_tuple[0]:
+        return False
+    record = game_board.make_move(*move)
+    same = played.position_key() == game_board.position_key() and played.bitboard.squares == game_board.bitboard.squares
+    game_board.unmake_move(record)
+    return same
+# Moves of every sequence shorter than depth from game_board that Board.shogi_main refuses,
+# as (texts of the moves before it, text of the move), and how many moves were checked
+def cross_check(game_board, depth, generate=engine.playable_moves, line=()):
+    refused, checked = [], 0
+    if depth == 0:
+        return refused, checked
+    for move in generate(game_board):
+        text = movegen.format_move(game_board, move)
+        checked += 1
+        if not shogi_main_accepts(game_board, move):
+            refused.append((line, text))
+        record = game_board.make_move(*move)
+        deeper, deeper_checked = cross_check(game_board, depth - 1, generate, line + (text,))
+        game_board.unmake_move(record)
+        refused.extend(deeper)
+        checked += deeper_checked
+    return refused, checked
+# Counts every depth from 1 to depth, returns [(depth, nodes, seconds)]
+def run(game_board, depth, cache=None, generate=engine.playable_moves):
+    results = []
+    for cur_depth in range(1, depth + 1):
+        start = time.perf_counter()
+        nodes = perft(game_board, cur_depth, cache, generate)
+        results.append((cur_depth, nodes, time.perf_counter() - start))
+    return results
+# Command line for perft, args are the arguments after -p
+def main(args):
+    rules = 'board'
+    if '-r' in args:
+        index = args.index('-r')
+        rules = args[index + 1]
+        args = args[:index] + args[index + 2:]
+    generate = RULES[rules]
+    cache = MoveCache(generate) if '-c' in args else None
+    check = '-x' in args
+    args = [arg for arg in args if arg not in ('-c', '-x')]
+    depth = int(args[0])
+    if len(args) > 1:
+        name, game_board = args[1], board.case_position(args[1])
+    else:
+        name, game_board = 'start', board.start_board()
+    expected = EXPECTED[rules].get(name, [])
+    failed = False
+    for cur_depth, nodes, seconds in run(game_board, depth, cache, generate):
+        rate = nodes / seconds if seconds else 0.0
+        line = 'depth %d: %d nodes in %.3f s (%.0f nodes/sec)' % (cur_depth, nodes, seconds, rate)
+        if cur_depth < len(expected):
+            if nodes == expected[cur_depth]:
+                line += ', ok'
+            else:
+                line += ', expected %d' % expected[cur_depth]
+                failed = True
+        print(line)
+    if cache is not None:
+        print('move cache: %d hits, %d misses (%.0f%% hits)' % (cache.hits, cache.misses, 100 * cache.hit_rate()))
+    if check:
+        refused, checked = cross_check(game_board, depth, generate)
+        print('shogi_main: %d of %d moves refused' % (len(refused), checked))
+        for line, text in refused:
+            print('  %s -> %s' % (' / '.join(line) or 'start', text))
+        failed = failed or bool(refused)
+    if failed:
+        sys.exit(1)
@@ -0,0 +1,139 @@
+"""
+Opt-in timings and call counts for the phases of playing a move.
+
+    BOXSHOGI_PROFILE=1 python3 boxshogi.py -f <file>            summary table on standard error
+    BOXSHOGI_PROFILE=out.json python3 boxshogi.py -f <file>     summary as JSON in out.json
+
+Enabling the profiler wraps the Board methods and movegen functions of every
+phase in PHASES, disabling it puts the originals back, so nothing is timed
+and nothing costs anything while it is off. A phase is timed from its
+outermost call, so a phase function calling another one of the same phase is
+counted once. Nodes are the moves the move generation functions return, and
+every call of Board.shogi_main is one ply. Only the process running
+boxshogi.py is profiled, not the workers of batch or self-play mode.
+"""
+import atexit
+import functools
+import json
+import os
+import sys
+import time
+from board import Board
+import movegen
+
+# Phase name to the (owner, function name) pairs timed for it
+PHASES = {
+    'ply': [(Board, 'shogi_main')],
+    'move generation': [(Board, 'move_information'), (Board, 'valid'),
+                        (movegen, 'pseudo_moves'), (movegen, 'legal_moves')],
+    'check detection': [(Board, 'move_check'), (Board, 'check'), (movegen, 'king_attacked')],
+    'drop legality': [(Board, 'drop_information'), (Board, 'check_piece_present'), (Board, 'preview_drop'),
+                      (Board, 'preview_double'), (Board, 'drop_preview_check'), (Board, 'drop_own'),
+                      (Board, 'check_drop_moves')],
+    'make/unmake': [(Board, 'make_move'), (Board, 'unmake_move')],
+    'rendering': [(Board, '_stringifyBoard'), (Board, 'report_recent_move'), (Board, 'report_end_capture'),
+                  (Board, 'write')],
+}
+# Functions whose returned list counts as generated nodes
+NODE_FUNCTIONS = frozenset(['valid', 'pseudo_moves', 'legal_moves'])
+# Environment variable that turns the profiler on for a boxshogi.py run
+ENVIRONMENT = 'BOXSHOGI_PROFILE'
+
+class Profiler:
+    """
+    Class that wraps the phase functions while enabled and adds up their calls and time
+    """
+    def __init__(self):
+        # PHASE_STATS: Phase to [outermost calls, seconds]
+        # FUNCTION_STATS: 'owner.function' to [calls, seconds including the functions it calls]
+        # PLY_NODES: Nodes generated during every ply
+        self.phase_stats = {phase: [0, 0.0] for phase in PHASES}
+        self.function_stats = {}
+        self.ply_nodes = []
+        self.nodes = 0
+        self._depth = {phase: 0 for phase in PHASES}
+        self._originals = []
+    # Wraps every phase function, until disable()
+    def enable(self):
+        if self._originals:
+            return
+        for phase, targets in PHASES.items():
+            for owner, name in targets:
+                original = owner.__dict__[name]
+                self._originals.append((owner, name, original))
+                setattr(owner, name, self._wrap(phase, owner, name, original))
+    # Puts the original functions back
+    def disable(self):
+        for owner, name, original in reversed(self._originals):
+            setattr(owner, name, original)
+        self._originals = []
+    def _wrap(self, phase, owner, name, original):
+        key = '%s.%s' % (owner.__name__, name)
+        function_stats = self.function_stats.setdefault(key, [0, 0.0])
+        phase_stats = self.phase_stats[phase]
+        depth = self._depth
+        counts_nodes = name in NODE_FUNCTIONS
+        is_ply = phase == 'ply'
+        @functools.wraps(original)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            start_nodes = self.nodes
+            depth[phase] += 1
+            try:
+                result = original(*args, **kwargs)
+            finally:
+                depth[phase] -= 1
+                seconds = time.perf_counter() - start
+                function_stats[0] += 1
+                function_stats[1] += seconds
+                if depth[phase] == 0:
+                    phase_stats[0] += 1
+                    phase_stats[1] += seconds
+                if is_ply:
+                    self.ply_nodes.append(self.nodes - start_nodes)
+            if counts_nodes and result is not None:
+                self.nodes += len(result)
+            return result
+        return wrapper
+    # Summary as a dict, what as_json() writes
+    def summary(self):
+        plies = len(self.ply_nodes)
+        return {
+            'phases': {phase: {'calls': calls, 'seconds': seconds} for phase, (calls, seconds) in self.phase_stats.items()},
+            'functions': {key: {'calls': calls, 'seconds': seconds} for key, (calls, seconds) in sorted(self.function_stats.items()) if calls},
+            'nodes': self.nodes,
+            'plies': plies,
+            'nodes_per_ply': sum(self.ply_nodes) / plies if plies else 0.0,
+            'max_nodes_per_ply': max(self.ply_nodes, default=0),
+        }
+    def as_json(self):
+        return json.dumps(self.summary(), indent=2)
+    # Summary as a text table, phases first and then every function called
+    def table(self):
+        summary = self.summary()
+        lines = ['%-40s %10s %12s %12s' % ('phase / function', 'calls', 'total ms', 'us per call')]
+        for group in ('phases', 'functions'):
+            for name, stats in summary[group].items():
+                calls, seconds = stats['calls'], stats['seconds']
+                per_call = 1e6 * seconds / calls if calls else 0.0
+                lines.append('%-40s %10d %12.3f %12.2f' % (name, calls, 1e3 * seconds, per_call))
+            lines.append('')
+        lines.append('%d nodes over %d plies, %.1f per ply, at most %d' % (summary['nodes'], summary['plies'], summary['nodes_per_ply'], summary['max_nodes_per_ply']))
+        return '\n'.join(lines)
+    # Writes the summary, as JSON when path is a .json file and as a table on standard error otherwise
+    def report(self, path=None):
+        if path and path.endswith('.json'):
+            with open(path, 'w') as f:
+                f.write(self.as_json() + '\n')
+        else:
+            print(self.table(), file=sys.stderr)
+
+# Enables a profiler reporting at exit when BOXSHOGI_PROFILE is set, returns it or None
+def from_environment():
+    setting = os.environ.get(ENVIRONMENT)
+    if not setting:
+        return None
+    profiler = Profiler()
+    profiler.enable()
+    atexit.register(profiler.report, setting)
+    return profiler
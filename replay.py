@@ -0,0 +1,156 @@
+"""
+Replay of a test case that can jump to any ply without playing the game again.
+
+The moves are played once the way file mode plays them. Replay keeps a
+snapshot of the whole position every interval plies and, for every ply, the
+squares, hands and turn it changed. seek() starts from the nearest snapshot
+below or above the ply, the last position counting as one, or from the
+current ply, whichever is closest, and steps forward or backward the rest of
+the way, so a jump costs at most interval / 2 steps plus a snapshot load.
+The position key of every ply is kept too, so the board's position history
+always holds the positions of the game up to the current ply.
+"""
+import io
+from collections import namedtuple
+import board
+from bitboard import NUM_SQUARES
+from outcome import ILLEGAL_MOVE, GameOver
+
+# State of the board a replay moves between, besides the pieces on squares
+# LAST_MOVE, PIECE_TYPE, POSITION: The Board attributes of the move that led here
+# KEY: Board.position_key() of the position
+State = namedtuple('State', ['upper_cap', 'lower_cap', 'turn', 'last_move', 'piece_type', 'position', 'key'])
+# Full position at a ply, SQUARES is a tuple like BitBoard.squares
+Snapshot = namedtuple('Snapshot', ['squares', 'state'])
+# What one ply changed
+# SQUARES: (square, piece before, piece after) for every square that changed
+# BEFORE, AFTER: State before and after the ply
+PlyDelta = namedtuple('PlyDelta', ['squares', 'before', 'after'])
+
+# Replay interval when none is given, a snapshot every this many plies
+INTERVAL = 16
+
+class Replay:
+    """
+    Class that holds a played test case and moves its board to any ply
+    """
+    # CASE: Test case from utils.parseTestCase or utils.iterTestCases
+    # INTERVAL: Plies between snapshots
+    def __init__(self, case, interval=INTERVAL):
+        self.interval = interval
+        self.board = board.case_board(case, out=io.StringIO())
+        self.snapshots = []
+        self.deltas = []
+        # END: Snapshot of the last position, so a seek near the end steps back from it
+        self.end = None
+        # OUTCOME: Outcome of the ending or illegal move that stopped the moves, None when every move was played
+        # ERROR: Exception a move raised in Board, like play_file would, the moves stop there too
+        self.outcome = None
+        self.error = None
+        self.ply = 0
+        self._play(case['moves'])
+    def __len__(self):
+        return len(self.deltas)
+    # Plays every move of the game, stopping at an illegal move or the end of the game
+    def _play(self, moves):
+        game_board = self.board
+        squares, state = tuple(game_board.bitboard.squares), self._state()
+        self.snapshots.append(Snapshot(squares, state))
+        for move in moves:
+            try:
+                game_board.shogi_main(move)
+                if game_board.illegal_tuple[0]:
+                    self.outcome = game_board.game_outcome(game_board.illegal_tuple[1], ILLEGAL_MOVE)
+            except GameOver as game_over:
+                self.outcome = game_over.outcome
+            except Exception as error:
+                self.error = error
+            # An illegal move ends the game without a position to replay
+            if self.outcome is not None or self.error is not None:
+                game_board.illegal_tuple = (False, '')
+                self._load(Snapshot(squares, state), len(self.deltas))
+                break
+            new_squares, new_state = tuple(game_board.bitboard.squares), self._state()
+            changed = tuple((sq, squares[sq], new_squares[sq]) for sq in range(NUM_SQUARES) if squares[sq] != new_squares[sq])
+            self.deltas.append(PlyDelta(changed, state, new_state))
+            squares, state = new_squares, new_state
+            if len(self.deltas) % self.interval == 0:
+                self.snapshots.append(Snapshot(squares, state))
+        self.end = Snapshot(squares, state)
+        self.ply = len(self.deltas)
+    # State of the board now
+    def _state(self):
+        game_board = self.board
+        last_move = list(game_board.last_move) if game_board.last_move else game_board.last_move
+        return State(tuple(game_board.upper_cap), tuple(game_board.lower_cap), game_board.turn, last_move, game_board.piece_type, game_board.position, game_board.position_key())
+    # Puts the board in state, the pieces on squares are set by the caller
+    def _set_state(self, state):
+        game_board = self.board
+        game_board.set_hands(state.upper_cap, state.lower_cap)
+        game_board.turn = state.turn
+        game_board.last_move = list(state.last_move) if state.last_move else state.last_move
+        game_board.piece_type = state.piece_type
+        game_board.position = state.position
+    # Position key after ply moves
+    def _key(self, ply):
+        return self.deltas[ply - 1].after.key if ply else self.snapshots[0].state.key
+    # Cuts or extends the board's position history to the positions up to ply
+    def _set_history(self, ply):
+        history = self.board.history
+        while len(history) > ply + 1:
+            history.pop()
+        while len(history) < ply + 1:
+            history.push(self._key(len(history)))
+    # Loads the snapshot of the position after ply moves onto the board
+    def _load(self, snapshot, ply):
+        bitboard = self.board.bitboard
+        for sq in range(NUM_SQUARES):
+            if bitboard.squares[sq] != snapshot.squares[sq]:
+                bitboard.replace(sq, snapshot.squares[sq])
+        self._set_state(snapshot.state)
+        self._set_history(ply)
+    # Plays the next ply, returns False at the end of the game
+    def forward(self):
+        if self.ply == len(self.deltas):
+            return False
+        delta = self.deltas[self.ply]
+        for sq, _, after in delta.squares:
+            self.board.bitboard.replace(sq, after)
+        self._set_state(delta.after)
+        self.board.history.push(delta.after.key)
+        self.ply += 1
+        return True
+    # Takes back the last ply, returns False at the start of the game
+    def backward(self):
+        if self.ply == 0:
+            return False
+        self.ply -= 1
+        delta = self.deltas[self.ply]
+        for sq, before, _ in delta.squares:
+            self.board.bitboard.replace(sq, before)
+        self._set_state(delta.before)
+        self.board.history.pop()
+        return True
+    # Moves the board to the position after ply moves, returns the board
+    def seek(self, ply):
+        if not 0 <= ply <= len(self.deltas):
+            raise IndexError('Ply %d of %d' % (ply, len(self.deltas)))
+        # The snapshot at or below ply and the one above it, the end of the game past the last one
+        below = ply // self.interval
+        if below + 1 < len(self.snapshots):
+            above, snapshot = (below + 1) * self.interval, self.snapshots[below + 1]
+        else:
+            above, snapshot = len(self.deltas), self.end
+        start = below * self.interval
+        if above - ply < ply - start:
+            start = above
+        else:
+            snapshot = self.snapshots[below]
+        if abs(ply - self.ply) > abs(ply - start):
+            self._load(snapshot, start)
+            self.ply = start
+        while self.ply < ply:
+            self.forward()
+        while self.ply > ply:
+            self.backward()
+        return self.board
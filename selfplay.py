@@ -0,0 +1,146 @@
+"""
+Self-play, plays games between built-in policies across a process pool.
+
+    python3 boxshogi.py -s <games> [-l <policy>] [-u <policy>] [-f <positions file>] [-r <seed>] [-p <processes>]
+                        [-b <book file>] [-o <output directory> | -t <test case file> | -g <record file>]
+
+Policies are random (any move Board accepts), greedy (the most valuable
+capture, otherwise random), search (engine.Engine two plies deep) and mcts
+(mcts.MCTS with MCTS_PLAYOUTS playouts), -l picks lower's and -u UPPER's,
+random by default. Games start from the
+interactive mode pieces, or from the test cases of -f in turn with their
+moves played first the way file mode plays them, a move file mode
+refuses stops with utils.TestCaseError. With -b both players play random book moves, weighted by
+games, while the book of book.py has the position. Game k uses its own random generator seeded from -r and
+k, so the same arguments write the same games whatever the process count.
+
+Games stop when the player to move has no move or after MAX_PLIES, and are
+written in order: one case file each with -o, one test case file with -t, a
+gamerecord file with -g and test case text on standard output otherwise.
+"""
+import os
+import random
+import sys
+import time
+from multiprocessing import Pool
+import board
+import book
+from bitboard import EMPTY
+import engine
+import gamerecord
+import mcts
+import movegen
+from outcome import MAX_PLIES
+from utils import iterTestCases
+
+# Plies the search policy looks ahead
+SEARCH_DEPTH = 2
+# Playouts of the mcts policy per move
+MCTS_PLAYOUTS = 200
+
+# Capture of the most valuable piece Board plays, a random move when there is none
+def greedy_move(game_board, rng):
+    side = movegen.side_to_move(game_board)
+    squares = game_board.bitboard.squares
+    captures = [move for move in movegen.pseudo_moves(game_board, side) if move[0] is not None and squares[move[1]] != EMPTY]
+    rng.shuffle(captures)
+    captures.sort(key=lambda move: engine.VALUES[squares[move[1]]], reverse=True)
+    for move in captures:
+        if engine.playable(game_board, move, side):
+            return move
+    return engine.random_move(game_board, rng)
+
+class SearchPolicy:
+    """
+    Class for the search policy, keeps one engine per game so its tables carry over between moves
+    """
+    def __init__(self):
+        self.engine = engine.Engine(time_limit=float('inf'), max_depth=SEARCH_DEPTH)
+    def __call__(self, game_board, rng):
+        return self.engine.choose(game_board)
+class MCTSPolicy:
+    """
+    Class for the mcts policy, its rollouts are seeded from the game's random generator
+    """
+    def __init__(self):
+        self.player = mcts.MCTS(time_limit=None, playouts=MCTS_PLAYOUTS)
+    def __call__(self, game_board, rng):
+        self.player.rng = rng
+        return self.player.choose(game_board)
+
+# Policy name to a function returning a new policy, a policy takes (board, rng) and returns a move
+POLICIES = {
+    'random': lambda: engine.random_move,
+    'greedy': lambda: greedy_move,
+    'search': SearchPolicy,
+    'mcts': MCTSPolicy,
+}
+
+# Plays game index, returns its test case
+# Task is (index, seed, lower policy, UPPER policy, starting test case or None, book file or None)
+def play_game(task):
+    index, seed, lower_policy, upper_policy, start, book_path = task
+    rng = random.Random('%d-%d' % (seed, index))
+    if start is None:
+        game_board = board.start_board()
+        case = dict(initialPieces=game_board.initial_state, upperCaptures=[], lowerCaptures=[], moves=[])
+    else:
+        game_board = board.played_board(start, '<positions file>')
+        case = dict(start, moves=list(start['moves']))
+    policies = (POLICIES[lower_policy](), POLICIES[upper_policy]())
+    opening_book = book.Book(book_path) if book_path is not None else None
+    try:
+        while len(case['moves']) < MAX_PLIES:
+            move = opening_book.choose(game_board, rng) if opening_book is not None else None
+            if move is None:
+                # Once out of the book a game does not come back to it
+                if opening_book is not None:
+                    opening_book.close()
+                    opening_book = None
+                move = policies[movegen.side_to_move(game_board)](game_board, rng)
+            if move is None:
+                break
+            case['moves'].append(movegen.format_move(game_board, move))
+            game_board.make_move(*move)
+    finally:
+        if opening_book is not None:
+            opening_book.close()
+    return case
+# Test cases of n games, in order, played on processes workers
+def play_games(n, lower_policy='random', upper_policy='random', starts=None, seed=0, processes=None, book_path=None):
+    starts = starts or [None]
+    tasks = ((index, seed, lower_policy, upper_policy, starts[index % len(starts)], book_path) for index in range(n))
+    processes = processes or os.cpu_count() or 1
+    chunksize = max(1, min(64, n // (processes * 4)))
+    with Pool(processes) as pool:
+        yield from pool.imap(play_game, tasks, chunksize)
+# Command line for self-play, args are the arguments after -s
+def main(args):
+    n = int(args[0])
+    options = dict(zip(args[1::2], args[2::2]))
+    for policy in (options.get('-l', 'random'), options.get('-u', 'random')):
+        if policy not in POLICIES:
+            raise ValueError('Unknown policy %r, one of %s' % (policy, ', '.join(sorted(POLICIES))))
+    starts = list(iterTestCases(options['-f'])) if '-f' in options else None
+    processes = int(options['-p']) if '-p' in options else None
+    cases = play_games(n, options.get('-l', 'random'), options.get('-u', 'random'), starts, int(options.get('-r', 0)), processes, options.get('-b'))
+    start = time.perf_counter()
+    if '-g' in options:
+        gamerecord.write_records(options['-g'], cases)
+    elif '-o' in options:
+        os.makedirs(options['-o'], exist_ok=True)
+        for index, case in enumerate(cases):
+            # A case file ends with its last move, parseTestCase reads a blank line after it as a move
+            with open(os.path.join(options['-o'], 'game%07d.in' % index), 'w') as f:
+                f.write(gamerecord.case_text(case)[:-1])
+    else:
+        out = open(options['-t'], 'w') if '-t' in options else sys.stdout
+        try:
+            for case in cases:
+                out.write(gamerecord.case_text(case))
+        finally:
+            if out is not sys.stdout:
+                out.close()
+    seconds = time.perf_counter() - start
+    rate = n / seconds if seconds else 0.0
+    print('%d games in %.2f s (%.1f games/sec)' % (n, seconds, rate), file=sys.stderr)
@@ -0,0 +1,269 @@
+"""
+Game server, many interactive mode games in one process over a line protocol.
+
+    python3 boxshogi.py -n serve <host:port or socket path> [-I <idle seconds>]
+    python3 boxshogi.py -n load <host:port or socket path> [-c <connections>] [-s <sessions>] [-m <moves per game>] [-r <seed>]
+
+serve listens on a TCP address like 127.0.0.1:7000 or, without a colon, on a
+Unix socket path. Every request is one line:
+
+    new                       starts a game, the reply names its session
+    <session> <move>          plays a move like 'move a1 b2' or 'drop p c3'
+    <session> stats           move latencies of a session
+    <session> quit            ends a session
+    stats                     sessions, moves and move latencies of the server
+
+Every reply is a status line '<status> <session> <count>' followed by count
+lines: ok when the game waits for its next move, over when it ended and the
+session is gone, error with the reason when the request failed. The lines of
+new and of a move are what interactive mode prints, its prompts included.
+Sessions do not belong to a connection, one connection can play many of
+them, and a session waiting longer than the idle time for a move is evicted.
+
+load plays random games against a server, spread over its connections, and
+reports throughput and reply latencies on standard error.
+"""
+import asyncio
+import io
+import random
+import sys
+import time
+from collections import deque
+import board
+import engine
+import movegen
+from outcome import MAX_PLIES, GameOver, render
+
+# Seconds a session may go without a move before it is evicted
+IDLE_TIMEOUT = 600
+# Move latencies of the whole server kept for its stats
+RECENT_LATENCIES = 100000
+# Reply statuses
+OK = 'ok'
+OVER = 'over'
+ERROR = 'error'
+
+# Lines describing latencies in seconds, in milliseconds
+def latency_lines(latencies):
+    ordered = sorted(latencies)
+    if not ordered:
+        return ['moves 0']
+    def percentile(share):
+        return 1e3 * ordered[min(len(ordered) - 1, int(share * len(ordered)))]
+    return [
+        'moves %d' % len(ordered),
+        'mean_ms %.3f' % (1e3 * sum(ordered) / len(ordered)),
+        'p50_ms %.3f' % percentile(0.5),
+        'p99_ms %.3f' % percentile(0.99),
+        'max_ms %.3f' % (1e3 * ordered[-1]),
+    ]
+# Lines of output text, without the empty string after its last newline
+def text_lines(text):
+    return text[:-1].split('\n') if text else []
+
+class Session:
+    """
+    Class for one interactive mode game of the server
+    """
+    def __init__(self, session_id):
+        self.id = session_id
+        self.out = io.StringIO()
+        self.board = board.start_board(out=self.out)
+        # LATENCIES: Seconds every move took to play
+        # LAST_ACTIVE: time.monotonic() of the last request
+        self.latencies = []
+        self.last_active = time.monotonic()
+    # Output written since the last call
+    def _take_output(self):
+        text = self.out.getvalue()
+        self.out.seek(0)
+        self.out.truncate()
+        return text
+    # Opening output of interactive mode, the board, the captures and lower's prompt
+    def start(self):
+        game_board = self.board
+        game_board.write(game_board.__str__())
+        game_board.report_end_capture()
+        game_board.write()
+        game_board.write('lower>')
+        return self._take_output()
+    # Plays a move like interactive mode, returns its output and the Outcome, None while the game goes on
+    # A move Board cannot read raises like it would in interactive mode
+    def play(self, move):
+        self.last_active = time.monotonic()
+        start = time.perf_counter()
+        outcome = None
+        try:
+            self.board.shogi_main(move)
+            # Without interactive set the next prompt is written instead of read
+            self.board.final_print_f()
+        except GameOver as game_over:
+            outcome = game_over.outcome
+        finally:
+            self.latencies.append(time.perf_counter() - start)
+        text = self._take_output()
+        if outcome is not None:
+            text += render(outcome)
+        return text, outcome
+
+class GameServer:
+    """
+    Class that holds the sessions of the server and answers requests
+    """
+    # IDLE_TIMEOUT: Seconds a session may go without a request before it is evicted
+    def __init__(self, idle_timeout=IDLE_TIMEOUT):
+        self.idle_timeout = idle_timeout
+        self.sessions = {}
+        self.next_id = 1
+        self.started = 0
+        self.finished = 0
+        self.evicted = 0
+        self.latencies = deque(maxlen=RECENT_LATENCIES)
+    # Answers one request line, returns (status, session, lines)
+    def request(self, line):
+        words = line.split(None, 1)
+        if not words:
+            return ERROR, '-', ['empty request']
+        if words[0] == 'new':
+            session = Session(str(self.next_id))
+            self.next_id += 1
+            self.started += 1
+            self.sessions[session.id] = session
+            return OK, session.id, text_lines(session.start())
+        if words[0] == 'stats':
+            lines = ['sessions %d' % len(self.sessions), 'started %d' % self.started, 'finished %d' % self.finished, 'evicted %d' % self.evicted]
+            return OK, '-', lines + latency_lines(self.latencies)
+        session = self.sessions.get(words[0])
+        if session is None:
+            return ERROR, words[0], ['unknown session']
+        command = words[1].strip() if len(words) > 1 else ''
+        if command == 'stats':
+            session.last_active = time.monotonic()
+            return OK, session.id, latency_lines(session.latencies)
+        if command == 'quit':
+            self.close(session)
+            return OVER, session.id, []
+        try:
+            text, outcome = session.play(command)
+        except Exception as error:
+            # The board may be left half way through the move, the game cannot go on
+            self.close(session)
+            return ERROR, session.id, ['%s: %s' % (type(error).__name__, error)]
+        self.latencies.append(session.latencies[-1])
+        if outcome is not None:
+            self.close(session)
+            return OVER, session.id, text_lines(text)
+        return OK, session.id, text_lines(text)
+    # Removes a session whose game is over
+    def close(self, session):
+        del self.sessions[session.id]
+        self.finished += 1
+    # Removes the sessions idle longer than the idle timeout, returns how many
+    def evict_idle(self):
+        oldest = time.monotonic() - self.idle_timeout
+        idle = [session for session in self.sessions.values() if session.last_active < oldest]
+        for session in idle:
+            del self.sessions[session.id]
+        self.evicted += len(idle)
+        return len(idle)
+    # Answers the request lines of one connection until it closes
+    async def handle_client(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                status, session, lines = self.request(line.decode(errors='replace'))
+                reply = ['%s %s %d' % (status, session, len(lines))] + lines
+                writer.write(('\n'.join(reply) + '\n').encode())
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+    async def _evict_forever(self):
+        while True:
+            await asyncio.sleep(self.idle_timeout / 4)
+            self.evict_idle()
+    # Serves address, host:port or a Unix socket path, until cancelled
+    async def serve(self, address):
+        if ':' in address:
+            host, port = address.rsplit(':', 1)
+            listener = await asyncio.start_server(self.handle_client, host, int(port))
+        else:
+            listener = await asyncio.start_unix_server(self.handle_client, address)
+        evictor = asyncio.ensure_future(self._evict_forever())
+        try:
+            async with listener:
+                await listener.serve_forever()
+        finally:
+            evictor.cancel()
+
+# Reader and writer connected to address, host:port or a Unix socket path
+async def open_connection(address):
+    if ':' in address:
+        host, port = address.rsplit(':', 1)
+        return await asyncio.open_connection(host, int(port))
+    return await asyncio.open_unix_connection(address)
+# Plays sessions random games over one connection, a move of every game in turn
+# Counts is a dict of games, moves and errors, latencies collects the seconds of every reply
+async def load_connection(address, sessions, max_moves, rng, counts, latencies):
+    reader, writer = await open_connection(address)
+    async def request(line):
+        start = time.perf_counter()
+        writer.write((line + '\n').encode())
+        status, session, count = (await reader.readline()).decode().split()
+        for _ in range(int(count)):
+            await reader.readline()
+        latencies.append(time.perf_counter() - start)
+        return status, session
+    # Every game is [session, board mirroring the server's, moves played]
+    games = []
+    for _ in range(sessions):
+        _, session = await request('new')
+        games.append([session, board.start_board(), 0])
+    try:
+        while games:
+            for game in list(games):
+                session, game_board, moves = game
+                move = engine.random_move(game_board, rng) if moves < max_moves else None
+                if move is None:
+                    await request(session + ' quit')
+                    games.remove(game)
+                    counts['games'] += 1
+                    continue
+                text = movegen.format_move(game_board, move)
+                game_board.make_move(*move)
+                status, _ = await request(session + ' ' + text)
+                game[2] += 1
+                counts['moves'] += 1
+                if status != OK:
+                    games.remove(game)
+                    counts['games'] += 1
+                    counts['errors'] += status == ERROR
+    finally:
+        writer.close()
+# Load generator, plays sessions games over connections connections and reports on standard error
+async def load(address, connections=10, sessions=1000, max_moves=MAX_PLIES, seed=0):
+    counts = {'games': 0, 'moves': 0, 'errors': 0}
+    latencies = []
+    start = time.perf_counter()
+    shares = [sessions // connections + (index < sessions % connections) for index in range(connections)]
+    await asyncio.gather(*(load_connection(address, share, max_moves, random.Random('%d-%d' % (seed, index)), counts, latencies)
+                           for index, share in enumerate(shares) if share))
+    seconds = time.perf_counter() - start
+    rate = len(latencies) / seconds if seconds else 0.0
+    print('%d games, %d moves, %d errors over %d connections in %.2f s (%.0f requests/sec)' % (counts['games'], counts['moves'], counts['errors'], connections, seconds, rate), file=sys.stderr)
+    print('reply ' + ', '.join(latency_lines(latencies)[1:]), file=sys.stderr)
+    return counts
+# Command line for the server and the load generator, args are the arguments after -n
+def main(args):
+    options = dict(zip(args[2::2], args[3::2]))
+    if args[0] == 'serve':
+        server = GameServer(float(options.get('-I', IDLE_TIMEOUT)))
+        try:
+            asyncio.run(server.serve(args[1]))
+        except KeyboardInterrupt:
+            pass
+    elif args[0] == 'load':
+        asyncio.run(load(args[1], int(options.get('-c', 10)), int(options.get('-s', 1000)), int(options.get('-m', MAX_PLIES)), int(options.get('-r', 0))))
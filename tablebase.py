@@ -0,0 +1,356 @@
+"""
+Endgame tablebases, the exact result of every position with both kings and a few other pieces.
+
+    python3 boxshogi.py -t build <tablebase file> [-r board|readme] <signature> [<signature> ...]
+    python3 boxshogi.py -t probe <tablebase file> <case file>
+
+A signature names the pieces besides the kings, like g or rp, wherever they
+are: on the board for either player, promoted or not, or in either capture
+hand. Captures only move pieces between the board and the hands, so the
+positions of a signature only lead to each other. Building a table numbers
+every position of the signature, plays every move of every position once to
+link it to the positions it leads to, then works back from the positions
+whose player to move has no move, which they lose like engine.Engine scores
+them: a position is won in n + 1 plies when one move reaches a position lost
+in n, and lost in n + 1 when every move reaches a won one, the last found in
+n. What is left after that is a draw.
+
+Moves follow the board rules of engine.playable, which Board.shogi_main
+plays by, or the README rules of movegen with -r readme, the rules the mate
+solver uses.
+
+Only signatures of one piece can be built. They have 65,000 (s) to 127,500
+positions and take about half a minute and under 20 MB. Every piece more
+multiplies the positions by 52 to 102, and at the same speed a two piece
+table would take hours, so build refuses any signature of more than
+MAX_POSITIONS positions before building anything.
+
+File layout, integers little endian:
+
+    header      b'BSTB', version (1 byte), rules (1 byte), table count (2 bytes)
+    directory   signature (8 bytes, padded with NUL), offset and size (8 bytes each), for every table
+    tables      one byte per position, 0 when the number is not a position, 1 for a draw,
+                2 + plies to the end when it is decided, won for the player to move when plies is odd
+"""
+import mmap
+import struct
+import sys
+from array import array
+import board
+import engine
+import movegen
+from bitboard import EMPTY, LOWER, NUM_SQUARES, PREVIEWS, UPPER, ZONE_MASKS
+
+MAGIC = b'BSTB'
+VERSION = 1
+HEADER = struct.Struct('<4sBBH')
+ENTRY = struct.Struct('<8sQQ')
+# Rules a file was built with, and the move generators of each
+BOARD_RULES = 0
+README_RULES = 1
+RULE_NAMES = {'board': BOARD_RULES, 'readme': README_RULES}
+RULE_MOVES = {BOARD_RULES: engine.playable_moves, README_RULES: movegen.legal_moves}
+# Results for the player to move
+WIN = 1
+DRAW = 0
+LOSS = -1
+# Bytes of a table
+NOT_A_POSITION = 0
+DRAW_CODE = 1
+FIRST_PLIES_CODE = 2
+MAX_PLIES = 255 - FIRST_PLIES_CODE
+# Pieces a signature can hold and the ones that promote
+PIECE_LETTERS = 'srgnp'
+PROMOTING_LETTERS = 'rgnp'
+KINGS = ('d', 'D')
+# Most positions of a table that can be built, every signature of one piece
+MAX_POSITIONS = 1 << 17
+
+# Every place a piece with this letter can be, (square, label) on the board or (None, label) in a capture hand
+# A hand piece is labelled like its owner's pieces, lower case in the lower hand
+def piece_states(letter):
+    states = []
+    for sq in range(NUM_SQUARES):
+        for label in (letter, letter.upper()):
+            states.append((sq, label))
+            if letter in PROMOTING_LETTERS:
+                states.append((sq, '+' + label))
+    states.append((None, letter))
+    states.append((None, letter.upper()))
+    return states
+# Signature of the pieces on game_board besides the kings, None when a king is missing or there is another
+def board_signature(game_board):
+    squares = game_board.bitboard.squares
+    letters = [piece.replace('+', '').lower() for piece in squares if piece != EMPTY]
+    if letters.count('d') != 2 or squares.count('d') != 1:
+        return None
+    letters.remove('d')
+    letters.remove('d')
+    letters.extend(piece.lower() for piece in game_board.upper_cap)
+    letters.extend(piece.lower() for piece in game_board.lower_cap)
+    return ''.join(sorted(letters))
+
+class Layout:
+    """
+    Class that numbers the positions of one signature
+    """
+    # Position number, from the most significant digit: player to move, lower king square,
+    # UPPER king square, then the state of every piece of the signature in order
+    def __init__(self, signature):
+        self.signature = ''.join(sorted(signature))
+        if any(letter not in PIECE_LETTERS for letter in self.signature):
+            raise ValueError('Signature %r may only hold %s' % (signature, PIECE_LETTERS))
+        self.states = [piece_states(letter) for letter in self.signature]
+        self.codes = [{state: code for code, state in enumerate(states)} for states in self.states]
+        self.size = 2 * NUM_SQUARES * NUM_SQUARES
+        for states in self.states:
+            self.size *= len(states)
+    # Position number of side to move, the king squares and the state codes of the pieces
+    def index(self, side, lower_king, upper_king, codes):
+        index = (side * NUM_SQUARES + lower_king) * NUM_SQUARES + upper_king
+        for states, code in zip(self.states, codes):
+            index = index * len(states) + code
+        return index
+    # (side, lower king square, UPPER king square, piece state codes) of a position number
+    def decode(self, index):
+        codes = []
+        for states in reversed(self.states):
+            index, code = divmod(index, len(states))
+            codes.append(code)
+        codes.reverse()
+        index, upper_king = divmod(index, NUM_SQUARES)
+        side, lower_king = divmod(index, NUM_SQUARES)
+        return side, lower_king, upper_king, codes
+    # Whether codes name each position once, pieces with the same letter in ascending state order
+    def canonical(self, codes):
+        signature = self.signature
+        return all(signature[slot - 1] != signature[slot] or codes[slot - 1] <= codes[slot] for slot in range(1, len(codes)))
+    # Position number of game_board, None when its pieces are not this signature
+    def board_index(self, game_board):
+        squares = game_board.bitboard.squares
+        by_letter = {}
+        lower_king = upper_king = None
+        for sq, piece in enumerate(squares):
+            if piece == EMPTY:
+                continue
+            if piece == KINGS[LOWER] and lower_king is None:
+                lower_king = sq
+            elif piece == KINGS[UPPER] and upper_king is None:
+                upper_king = sq
+            else:
+                by_letter.setdefault(piece.replace('+', '').lower(), []).append((sq, piece))
+        for piece in list(game_board.lower_cap) + list(game_board.upper_cap):
+            by_letter.setdefault(piece.lower(), []).append((None, piece))
+        if lower_king is None or upper_king is None:
+            return None
+        codes = []
+        for slot, letter in enumerate(self.signature):
+            if slot == 0 or self.signature[slot - 1] != letter:
+                letter_states = by_letter.pop(letter, [])
+                try:
+                    letter_codes = sorted(self.codes[slot][state] for state in letter_states)
+                except KeyError:
+                    return None
+                if len(letter_codes) != self.signature.count(letter):
+                    return None
+                codes.extend(letter_codes)
+        if by_letter:
+            return None
+        return self.index(movegen.side_to_move(game_board), lower_king, upper_king, codes)
+    # Puts the position with number index on game_board, returns False when the number is not a position
+    # Not a position: two pieces on a square, a number naming it twice, an unpromoted Preview on its
+    # last rank or the player who just moved in check
+    def set_board(self, game_board, index):
+        side, lower_king, upper_king, codes = self.decode(index)
+        if lower_king == upper_king or not self.canonical(codes):
+            return False
+        occupied = (1 << lower_king) | (1 << upper_king)
+        pieces, hands = [], ([], [])
+        for states, code in zip(self.states, codes):
+            sq, label = states[code]
+            if sq is None:
+                hands[UPPER if label.isupper() else LOWER].append(label)
+                continue
+            if occupied >> sq & 1:
+                return False
+            if label in PREVIEWS and ZONE_MASKS[UPPER if label.isupper() else LOWER] >> sq & 1:
+                return False
+            occupied |= 1 << sq
+            pieces.append((sq, label))
+        bitboard = game_board.bitboard
+        bitboard.clear()
+        bitboard.put(lower_king, KINGS[LOWER])
+        bitboard.put(upper_king, KINGS[UPPER])
+        for sq, label in pieces:
+            bitboard.put(sq, label)
+        game_board.set_hands(hands[UPPER], hands[LOWER])
+        game_board.turn = side
+        return not movegen.king_attacked(game_board, 1 - side)
+
+# Board positions are set on while a table is built
+def empty_board():
+    game_board = board.Board(None, [], [], [], [], (False, ''), 0, None, None, None)
+    game_board.init_board()
+    return game_board
+# Layout of a signature a table can be built for, ValueError when it has too many positions
+def buildable_layout(signature):
+    layout = Layout(signature)
+    if layout.size > MAX_POSITIONS:
+        raise ValueError('Signature %s has %d positions, tables of more than %d cannot be built' % (layout.signature, layout.size, MAX_POSITIONS))
+    return layout
+# Table bytes of a signature under rules, see the file layout
+def build_table(signature, rules=BOARD_RULES):
+    layout = buildable_layout(signature)
+    generate = RULE_MOVES[rules]
+    game_board = empty_board()
+    valid = bytearray(layout.size)
+    # REMAINING: Moves of every position not yet known to reach a won position
+    # SUCCESSORS: Position reached by every move, those of a position follow the ones of the position before
+    remaining = array('H', [0]) * layout.size
+    successors = array('i')
+    for index in range(layout.size):
+        if not layout.set_board(game_board, index):
+            continue
+        valid[index] = 1
+        moves = generate(game_board)
+        remaining[index] = len(moves)
+        for move in moves:
+            record = game_board.make_move(*move)
+            successors.append(layout.board_index(game_board))
+            game_board.unmake_move(record)
+    # Predecessors of every position, those of position i are ORDERED[FIRST[i]:FIRST[i + 1]]
+    first = array('i', [0]) * (layout.size + 1)
+    for successor in successors:
+        first[successor + 1] += 1
+    for index in range(layout.size):
+        first[index + 1] += first[index]
+    filled = array('i', first)
+    ordered = array('i', [0]) * len(successors)
+    edge = 0
+    for index in range(layout.size):
+        for successor in successors[edge:edge + remaining[index]]:
+            ordered[filled[successor]] = index
+            filled[successor] += 1
+        edge += remaining[index]
+    del successors, filled
+    # Work back from the positions without a move, one ply at a time
+    table = bytearray(DRAW_CODE if valid[index] else NOT_A_POSITION for index in range(layout.size))
+    frontier = [index for index in range(layout.size) if valid[index] and remaining[index] == 0]
+    plies = 0
+    for index in frontier:
+        table[index] = FIRST_PLIES_CODE
+    while frontier:
+        if plies >= MAX_PLIES:
+            raise ValueError('Signature %s has a result longer than %d plies' % (layout.signature, MAX_PLIES))
+        code = FIRST_PLIES_CODE + plies + 1
+        lost = plies % 2 == 0
+        next_frontier = []
+        for index in frontier:
+            for predecessor in ordered[first[index]:first[index + 1]]:
+                if table[predecessor] != DRAW_CODE:
+                    continue
+                if not lost:
+                    remaining[predecessor] -= 1
+                    if remaining[predecessor]:
+                        continue
+                table[predecessor] = code
+                next_frontier.append(predecessor)
+        frontier = next_frontier
+        plies += 1
+    return layout.signature, bytes(table)
+# Builds the tables of signatures into path, returns the number of positions written
+def write_tables(path, signatures, rules=BOARD_RULES, report=None):
+    for signature in signatures:
+        buildable_layout(signature)
+    tables = []
+    for signature in signatures:
+        tables.append(build_table(signature, rules))
+        if report is not None:
+            report(tables[-1])
+    offset = HEADER.size + ENTRY.size * len(tables)
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, rules, len(tables)))
+        for signature, table in tables:
+            f.write(ENTRY.pack(signature.encode(), offset, len(table)))
+            offset += len(table)
+        for _, table in tables:
+            f.write(table)
+    return sum(len(table) for _, table in tables)
+
+class Tablebases:
+    """
+    Class that answers positions from a tablebase file without reading it into memory
+    """
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.rules, count = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('%s is not a version %d tablebase file' % (path, VERSION))
+        # TABLES: Signature to (Layout, offset of its table)
+        # MAX_PIECES: Most pieces besides the kings in a table, positions with more are not looked up
+        self.tables = {}
+        for entry in range(count):
+            signature, offset, _ = ENTRY.unpack_from(self.data, HEADER.size + entry * ENTRY.size)
+            signature = signature.rstrip(b'\0').decode()
+            self.tables[signature] = (Layout(signature), offset)
+        self.max_pieces = max((len(signature) for signature in self.tables), default=0)
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc_info):
+        self.close()
+    def close(self):
+        self.data.close()
+        self.file.close()
+    # (WIN, LOSS or DRAW for the player to move, plies to the end, 0 for a draw) of game_board,
+    # None when no table covers it
+    def probe(self, game_board):
+        bitboard = game_board.bitboard
+        pieces = bin(bitboard.occupancy()).count('1') - 2 + len(game_board.upper_cap) + len(game_board.lower_cap)
+        if pieces > self.max_pieces:
+            return None
+        signature = board_signature(game_board)
+        if signature not in self.tables:
+            return None
+        layout, offset = self.tables[signature]
+        index = layout.board_index(game_board)
+        if index is None:
+            return None
+        code = self.data[offset + index]
+        if code == NOT_A_POSITION:
+            return None
+        if code == DRAW_CODE:
+            return DRAW, 0
+        plies = code - FIRST_PLIES_CODE
+        return (WIN if plies % 2 else LOSS), plies
+
+# Text of a probe result
+def result_text(found):
+    if found is None:
+        return 'Not in the tablebase'
+    result, plies = found
+    if result == DRAW:
+        return 'Draw'
+    return '%s in %d plies' % ('Win' if result == WIN else 'Loss', plies)
+# Command line for tablebases, args are the arguments after -t
+def main(args):
+    if args[0] == 'build':
+        rest = args[2:]
+        rules = BOARD_RULES
+        if rest[:1] == ['-r']:
+            rules, rest = RULE_NAMES[rest[1]], rest[2:]
+        def report(table):
+            signature, data = table
+            counts = [0, 0, 0]
+            for code in data:
+                if code == DRAW_CODE:
+                    counts[1] += 1
+                elif code != NOT_A_POSITION:
+                    counts[0 if (code - FIRST_PLIES_CODE) % 2 else 2] += 1
+            longest = max(data) - FIRST_PLIES_CODE if max(data) >= FIRST_PLIES_CODE else 0
+            print('%s: %d won, %d drawn, %d lost, longest %d plies' % (signature, counts[0], counts[1], counts[2], longest), file=sys.stderr)
+        positions = write_tables(args[1], rest, rules, report)
+        print('%d positions written to %s' % (positions, args[1]), file=sys.stderr)
+    elif args[0] == 'probe':
+        with Tablebases(args[1]) as tablebases:
+            print(result_text(tablebases.probe(board.case_position(args[2]))))
@@ -1,24 +1,154 @@
+import glob
+import os
+import re
+import sys
+
+# Bytes read from a file at a time by iterTestCases
+BUFFER_SIZE = 1 << 20
+# Piece labels, capture hand letters, board positions and moves a test case may hold
+PIECE_RE = re.compile(r'\+?[dsrgnpDSRGNP]$')
+CAPTURE_RE = re.compile(r'[dsrgnpDSRGNP]$')
+POSITION_RE = re.compile(r'[a-e][1-5]$')
+MOVE_RE = re.compile(r'(move [a-e][1-5] [a-e][1-5]( promote)?|drop [A-Za-z] [a-e][1-5])$')
+# Sections of a test case, in file order
+PIECES, UPPER_CAPTURES, LOWER_CAPTURES, SEPARATOR, MOVES = range(5)
+
+class TestCaseError(ValueError):
+    """
+    Error in a test case file, names the file and line
+    """
+    def __init__(self, name, line_number, message):
+        super().__init__('%s:%d: %s' % (name, line_number, message))
+        self.name = name
+        self.line_number = line_number
+
 def parseTestCase(path):
     """
     Utility function to help parse test cases.
     :param path: Path to test case file.
     """
-    f = open(path)
-    line = f.readline()
-    initialBoardState = []
-    while line != '\n':
-        piece, position = line.strip().split(' ')
-        initialBoardState.append(dict(piece=piece, position=position))
+    with open(path) as f:
         line = f.readline()
-    line = f.readline().strip()
-    upperCaptures = [x for x in line[1:-1].split(' ') if x != '']
-    line = f.readline().strip()
-    lowerCaptures = [x for x in line[1:-1].split(' ') if x != '']
-    line = f.readline()
-    line = f.readline()
-    moves = []
-    while line != '':
-        moves.append(line.strip())
+        initialBoardState = []
+        while line != '\n':
+            piece, position = line.strip().split(' ')
+            initialBoardState.append(dict(piece=piece, position=position))
+            line = f.readline()
+        line = f.readline().strip()
+        upperCaptures = [x for x in line[1:-1].split(' ') if x != '']
+        line = f.readline().strip()
+        lowerCaptures = [x for x in line[1:-1].split(' ') if x != '']
         line = f.readline()
+        line = f.readline()
+        moves = []
+        while line != '':
+            moves.append(line.strip())
+            line = f.readline()
 
     return dict(initialPieces=initialBoardState, upperCaptures=upperCaptures, lowerCaptures=lowerCaptures, moves=moves)
+
+def iterTestCases(source):
+    """
+    Generator over the test cases of a file holding one or many of them, one at a time.
+    Test cases are written like the files parseTestCase reads and separated by a blank line
+    after their moves, so a test case without moves ends with two blank lines. Every case is a dict like parseTestCase returns, so it can be given to
+    board.play_case or board.case_board as is.
+    :param source: Path to the file, '-' for standard input, or an open text file.
+    """
+    if source == '-':
+        yield from parseTestCaseLines(sys.stdin, '<stdin>')
+    elif isinstance(source, str):
+        with open(source, buffering=BUFFER_SIZE) as f:
+            yield from parseTestCaseLines(f, source)
+    else:
+        yield from parseTestCaseLines(source, getattr(source, 'name', '<stream>'))
+
+def parseTestCaseLines(lines, name):
+    """
+    Generator over the test cases in lines, raises TestCaseError at the first line that is wrong.
+    :param lines: Iterable of lines like an open file.
+    :param name: Name of the file in errors.
+    """
+    case, section, line_number = None, None, 0
+    for line_number, line in enumerate(lines, 1):
+        text = line.strip()
+        if case is None:
+            # Blank lines between test cases
+            if not text:
+                continue
+            case = dict(initialPieces=[], upperCaptures=[], lowerCaptures=[], moves=[])
+            section = PIECES
+        if section == PIECES:
+            if not text:
+                section = UPPER_CAPTURES
+                continue
+            fields = text.split(' ')
+            if len(fields) != 2 or not PIECE_RE.match(fields[0]) or not POSITION_RE.match(fields[1]):
+                raise TestCaseError(name, line_number, 'expected a piece and position like "p a2", got %r' % text)
+            case['initialPieces'].append(dict(piece=fields[0], position=fields[1]))
+        elif section in (UPPER_CAPTURES, LOWER_CAPTURES):
+            if not text.startswith('[') or not text.endswith(']'):
+                raise TestCaseError(name, line_number, 'expected captures like "[p G]", got %r' % text)
+            captures = [x for x in text[1:-1].split(' ') if x != '']
+            for capture in captures:
+                if not CAPTURE_RE.match(capture):
+                    raise TestCaseError(name, line_number, 'not a piece that can be captured: %r' % capture)
+            key = 'upperCaptures' if section == UPPER_CAPTURES else 'lowerCaptures'
+            case[key] = captures
+            section += 1
+        elif section == SEPARATOR:
+            if text:
+                raise TestCaseError(name, line_number, 'expected a blank line before the moves, got %r' % text)
+            section = MOVES
+        elif not text:
+            yield case
+            case = None
+        else:
+            if not MOVE_RE.match(text):
+                raise TestCaseError(name, line_number, 'expected a move like "move a1 b2" or "drop p c3", got %r' % text)
+            case['moves'].append(text)
+    if case is not None:
+        if section < SEPARATOR:
+            raise TestCaseError(name, line_number, 'file ended before the captures of the test case')
+        yield case
+
+def corpus_cases(source):
+    """
+    Generator over the test cases of a corpus, one at a time.
+    :param source: A test case file of one or many games, a gamerecord file, a directory of
+    case files or a glob of them, or '-' for standard input.
+    """
+    # gamerecord reads test cases with this module, so it is imported once a corpus is read
+    import gamerecord
+    if source == '-':
+        yield from iterTestCases(source)
+    elif os.path.isfile(source):
+        with open(source, 'rb') as f:
+            magic = f.read(len(gamerecord.MAGIC))
+        if magic == gamerecord.MAGIC:
+            with gamerecord.GameRecords(source) as records:
+                yield from records
+        else:
+            yield from iterTestCases(source)
+    else:
+        paths = glob.glob(os.path.join(source, '*.in')) if os.path.isdir(source) else glob.glob(source)
+        for path in sorted(paths):
+            yield parseTestCase(path)
+
+def parse_options(args, flags):
+    """
+    Splits command line arguments into flags with their values and the other arguments, in any order.
+    :param args: Arguments after the mode, like sys.argv[3:].
+    :param flags: Flags that take the argument after them as their value, like ('-n', '-s').
+    :return: (list of the other arguments, dict of flag to value)
+    """
+    rest, options = [], {}
+    index = 0
+    while index < len(args):
+        if args[index] in flags and index + 1 < len(args):
+            options[args[index]] = args[index + 1]
+            index += 2
+        else:
+            rest.append(args[index])
+            index += 1
+    return rest, options
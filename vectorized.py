@@ -0,0 +1,212 @@
+"""
+NumPy batch move generation, legal moves and check for many positions at once.
+
+Positions are arrays instead of Board objects:
+
+    pieces  (N, 25) int8, the code of the piece on every square, 0 when empty
+    hands   (N, 2, 6) int8, how many of each HAND_LETTERS the lower and UPPER hand hold
+    sides   (N,) int8, the player to move, bitboard.LOWER or bitboard.UPPER
+
+Moves follow the board rules of engine.playable_moves, the rules Board plays
+by, or with rules='readme' the README rules of movegen.legal_moves. Hands
+count only the letters of their owner's case, the ones that can be dropped,
+and under the board rules a hand with none of them counts as empty. Games
+never put the other player's letters in a hand, only a test case can.
+Attacks of every piece come from
+step and ray tables built from attacks.STEPS and attacks.RAYS. A ray
+reaches a square when every square before it is empty. Legality is decided
+by making every candidate move on a copy of its position and looking for
+attacks on the mover's king square, all candidates of all positions in one
+batch.
+
+NumPy is needed for this module only; the rest of BoxShogi runs without it.
+"""
+from collections import namedtuple
+import numpy as np
+from attacks import KING, NO_RAYS, RAYS, STEPS
+from bitboard import BOARD_SIZE, LOWER, NUM_SQUARES, UPPER, EMPTY, square
+
+# Piece labels by code, code 0 is an empty square
+LOWER_LABELS = ['d', 's', 'r', 'g', 'n', 'p', '+r', '+g', '+n', '+p']
+LABELS = [EMPTY] + LOWER_LABELS + [label.upper() for label in LOWER_LABELS]
+CODES = {label: code for code, label in enumerate(LABELS)}
+NUM_CODES = len(LABELS)
+HAND_LETTERS = 'dsrgnp'
+# Side of every code, -1 for an empty square
+CODE_SIDES = np.array([-1] + [LOWER] * len(LOWER_LABELS) + [UPPER] * len(LOWER_LABELS), dtype=np.int8)
+KING_CODES = np.array([CODES['d'], CODES['D']], dtype=np.int8)
+PREVIEW_CODES = np.array([CODES['p'], CODES['P']], dtype=np.int8)
+PROMOTED_PREVIEW_CODES = np.array([CODES['+p'], CODES['+P']], dtype=np.int8)
+# Codes that can be promoted
+PROMOTABLE = np.array([label in ('r', 'g', 'n', 'p', 'R', 'G', 'N', 'P') for label in LABELS])
+# Column of every square and the promotion zone column of lower and UPPER
+COLUMNS = np.arange(NUM_SQUARES) % BOARD_SIZE
+ZONE_COLUMNS = np.array([BOARD_SIZE - 1, 0])
+# Column of the first rank of lower and UPPER, the same as engine.FIRST_RANKS
+FIRST_COLUMNS = np.array([0, BOARD_SIZE - 1])
+FILES = np.arange(NUM_SQUARES) // BOARD_SIZE
+MAX_RAYS = 4
+MAX_RAY_LENGTH = BOARD_SIZE - 1
+
+# STEP_TABLE: code, square, target, whether the piece steps from square to target
+# RAY_TABLE: code, square, ray, k, the k-th square out along the ray, -1 past its end
+# KING_RAYS: square, direction of KING, k, the k-th square out from square, -1 past the edge
+# SLIDES: code, direction of KING, whether the piece slides back along it towards the square
+STEP_TABLE = np.zeros((NUM_CODES, NUM_SQUARES, NUM_SQUARES), dtype=bool)
+RAY_TABLE = np.full((NUM_CODES, NUM_SQUARES, MAX_RAYS, MAX_RAY_LENGTH), -1, dtype=np.int8)
+KING_RAYS = np.full((NUM_SQUARES, len(KING), MAX_RAY_LENGTH), -1, dtype=np.intp)
+SLIDES = np.zeros((NUM_CODES, len(KING)), dtype=bool)
+for _code, _label in enumerate(LABELS):
+    for _sq in range(NUM_SQUARES):
+        for _, _target in STEPS.get(_label, NO_RAYS)[_sq]:
+            STEP_TABLE[_code, _sq, _target] = True
+        for _ray, (_dr, _dc, _squares) in enumerate(RAYS.get(_label, NO_RAYS)[_sq]):
+            SLIDES[_code, KING.index((-_dr, -_dc))] = True
+            for _k, (_, _target) in enumerate(_squares):
+                RAY_TABLE[_code, _sq, _ray, _k] = _target
+for _sq in range(NUM_SQUARES):
+    for _direction, (_dr, _dc) in enumerate(KING):
+        _row, _col = divmod(_sq, BOARD_SIZE)
+        for _k in range(MAX_RAY_LENGTH):
+            _row, _col = _row + _dr, _col + _dc
+            if not (0 <= _row < BOARD_SIZE and 0 <= _col < BOARD_SIZE):
+                break
+            KING_RAYS[_sq, _direction, _k] = square(_row, _col)
+
+# Legal moves of N positions
+# MOVES: (N, 25, 25) bool, a piece may move from a square to a target
+# PROMOTIONS: (N, 25, 25) bool, the move may be made promoting
+# FORCED: (N, 25, 25) bool, the move must promote, a Preview entering its zone
+# DROPS: (N, 6, 25) bool, a piece of HAND_LETTERS may be dropped on a square
+# IN_CHECK: (N,) bool, the player to move is in check
+LegalMoves = namedtuple('LegalMoves', ['moves', 'promotions', 'forced', 'drops', 'in_check'])
+
+# Arrays of positions from Board objects, the player to move from the turn like movegen.side_to_move
+def encode(boards):
+    pieces = np.zeros((len(boards), NUM_SQUARES), dtype=np.int8)
+    hands = np.zeros((len(boards), 2, len(HAND_LETTERS)), dtype=np.int8)
+    sides = np.zeros(len(boards), dtype=np.int8)
+    for n, game_board in enumerate(boards):
+        for sq, piece in enumerate(game_board.bitboard.squares):
+            if piece not in CODES:
+                raise ValueError('No code for piece %r' % piece)
+            pieces[n, sq] = CODES[piece]
+        # Like movegen.pseudo_moves, only pieces of the hand owner's case can be dropped
+        for side, hand in ((UPPER, game_board.upper_cap), (LOWER, game_board.lower_cap)):
+            for piece, count in hand.items():
+                if piece.isupper() == (side == UPPER):
+                    hands[n, side, HAND_LETTERS.index(piece.lower())] += count
+        sides[n] = UPPER if game_board.turn % 2 == 1 else LOWER
+    return pieces, hands, sides
+# (N, 25, 25) bool, the squares the piece on every square attacks
+def attack_sets(pieces):
+    squares = np.arange(NUM_SQUARES)
+    attacks = STEP_TABLE[pieces, squares]
+    rays = RAY_TABLE[pieces, squares].astype(np.intp)
+    on_board = rays >= 0
+    # A ray square is reached when every square before it on the ray is empty
+    occupied = np.take_along_axis(pieces[:, None, None, :], np.where(on_board, rays, 0).reshape(len(pieces), 1, 1, NUM_SQUARES * MAX_RAYS * MAX_RAY_LENGTH), axis=3)
+    occupied = occupied.reshape(rays.shape) != 0
+    open_before = np.cumprod(~occupied, axis=3)
+    reached = on_board.copy()
+    reached[..., 1:] &= open_before[..., :-1].astype(bool)
+    n_index, sq_index, _, _ = np.nonzero(reached)
+    attacks[n_index, sq_index, rays[reached]] = True
+    return attacks
+# (N, 25) bool, the squares a piece of sides attacks, sides is (N,)
+def attacked_by(pieces, sides):
+    attacks = attack_sets(pieces)
+    owners = CODE_SIDES[pieces] == sides[:, None]
+    return (attacks & owners[:, :, None]).any(axis=1)
+# (N,) bool, whether the king of sides can be captured, False when it is not on the board
+# Only the king square is looked at: steppers through STEP_TABLE and the first piece out along every direction
+def king_attacked(pieces, sides):
+    count = len(pieces)
+    kings = pieces == KING_CODES[sides][:, None]
+    # The lowest square like BitBoard.find when there is more than one
+    king_squares = kings.argmax(axis=1)
+    opponents = (1 - sides)[:, None]
+    steppers = STEP_TABLE[pieces, np.arange(NUM_SQUARES), king_squares[:, None]] & (CODE_SIDES[pieces] == opponents)
+    rays = KING_RAYS[king_squares]
+    on_board = rays >= 0
+    blockers = np.take_along_axis(pieces, np.where(on_board, rays, 0).reshape(count, len(KING) * MAX_RAY_LENGTH), axis=1).reshape(rays.shape)
+    blockers = np.where(on_board, blockers, 0)
+    occupied = blockers != 0
+    first = np.take_along_axis(blockers, occupied.argmax(axis=2)[:, :, None], axis=2)[:, :, 0]
+    sliders = SLIDES[first, np.arange(len(KING))] & (CODE_SIDES[first] == opponents)
+    return kings.any(axis=1) & (steppers.any(axis=1) | sliders.any(axis=1))
+# Rules legal_moves follows, see engine.playable and movegen.legal_moves
+RULES = ('board', 'readme')
+
+# Legal moves and check of every position, see LegalMoves
+# DROP_MATE: Whether the README rule against a Preview drop that mates is applied
+def legal_moves(pieces, hands, sides, rules='board', drop_mate=True):
+    if rules not in RULES:
+        raise ValueError('Unknown rules %r, one of %s' % (rules, ', '.join(RULES)))
+    pieces = np.asarray(pieces, dtype=np.int8)
+    hands = np.asarray(hands, dtype=np.int8)
+    sides = np.asarray(sides, dtype=np.int8)
+    count = len(pieces)
+    piece_sides = CODE_SIDES[pieces]
+    own = piece_sides == sides[:, None]
+    empty = pieces == 0
+    in_check = king_attacked(pieces, sides)
+
+    # Board moves, legal when the mover's king is not attacked after them
+    targets = attack_sets(pieces) & own[:, :, None] & ~own[:, None, :]
+    n_index, start, end = np.nonzero(targets)
+    after = pieces[n_index].copy()
+    moved = after[np.arange(len(n_index)), start]
+    after[np.arange(len(n_index)), end] = moved
+    after[np.arange(len(n_index)), start] = 0
+    legal = ~king_attacked(after, sides[n_index])
+    moves = np.zeros((count, NUM_SQUARES, NUM_SQUARES), dtype=bool)
+    moves[n_index[legal], start[legal], end[legal]] = True
+    # CASE: Board rules, a promoted Preview may not move to its own first rank
+    if rules == 'board':
+        promoted = pieces == PROMOTED_PREVIEW_CODES[sides][:, None]
+        moves &= ~(promoted[:, :, None] & (COLUMNS[None, None, :] == FIRST_COLUMNS[sides][:, None, None]))
+    zones = ZONE_COLUMNS[sides][:, None, None]
+    in_zone = (COLUMNS[None, :, None] == zones) | (COLUMNS[None, None, :] == zones)
+    promotions = moves & PROMOTABLE[pieces][:, :, None] & in_zone
+    previews = pieces == PREVIEW_CODES[sides][:, None]
+    forced = moves & previews[:, :, None] & (COLUMNS[None, None, :] == ZONE_COLUMNS[sides][:, None, None])
+
+    # Drops, on empty squares, Previews not in the zone nor on a file holding one
+    held = hands[np.arange(count), sides] > 0
+    drops = held[:, :, None] & empty[:, None, :]
+    preview = HAND_LETTERS.index('p')
+    preview_files = np.zeros((count, BOARD_SIZE), dtype=bool)
+    preview_n, preview_sq = np.nonzero(previews)
+    preview_files[preview_n, FILES[preview_sq]] = True
+    drops[:, preview] &= ~preview_files[:, FILES] & (COLUMNS[None, :] != ZONE_COLUMNS[sides][:, None])
+    # CASE: Board rules, no drop while either hand is empty
+    if rules == 'board':
+        drops &= (hands.sum(axis=2) > 0).all(axis=1)[:, None, None]
+    n_index, letter, end = np.nonzero(drops)
+    after = pieces[n_index].copy()
+    dropped = np.array([CODES[label] for label in HAND_LETTERS], dtype=np.int8)[letter] + sides[n_index] * len(LOWER_LABELS)
+    after[np.arange(len(n_index)), end] = dropped
+    legal = ~king_attacked(after, sides[n_index])
+    # CASE: Board rules, a Preview drop may not check the other king, mate or not
+    if rules == 'board':
+        checks = legal & (letter == preview)
+        checks[checks] = king_attacked(after[checks], 1 - sides[n_index[checks]])
+        legal &= ~checks
+    # CASE: Preview dropped immediately causing mate
+    elif drop_mate:
+        mate_check = legal & (letter == preview)
+        mate_check[mate_check] = king_attacked(after[mate_check], 1 - sides[n_index[mate_check]])
+        if mate_check.any():
+            reply_hands = hands[n_index[mate_check]].copy()
+            reply_hands[np.arange(mate_check.sum()), sides[n_index[mate_check]], preview] -= 1
+            replies = legal_moves(after[mate_check], reply_hands, 1 - sides[n_index[mate_check]], 'readme', False)
+            has_reply = replies.moves.any(axis=(1, 2)) | replies.drops.any(axis=(1, 2))
+            legal[mate_check] = has_reply
+    drops = np.zeros((count, len(HAND_LETTERS), NUM_SQUARES), dtype=bool)
+    drops[n_index[legal], letter[legal], end[legal]] = True
+    return LegalMoves(moves, promotions, forced, drops, in_check)
+# Number of legal moves of every position, counted like len(engine.playable_moves()) or len(movegen.legal_moves()), drops of the same letter once
+def move_counts(legal):
+    boards = legal.moves.sum(axis=(1, 2)) + (legal.promotions & ~legal.forced).sum(axis=(1, 2))
+    return boards + legal.drops.sum(axis=(1, 2))
@@ -0,0 +1,51 @@
+"""
+Zobrist keys of BoxShogi positions.
+
+A position key is the XOR of one random 64-bit key per piece on its square,
+one key per (hand, piece, count) for the capture hands and a side key when
+UPPER is to move. BitBoard keeps the piece part and Board keeps the hand
+part as pieces move, so Board.position_key() costs a few XORs per ply.
+"""
+import random
+
+# Same as bitboard.NUM_SQUARES, bitboard imports this module
+NUM_SQUARES = 5 * 5
+
+# Keys are fixed so they are the same in every process and every run
+SEED = 0x5B0C5
+# Most pieces of one kind a hand can hold, every piece on the board of the same kind
+MAX_HAND = NUM_SQUARES
+
+_random = random.Random(SEED)
+# Random 64-bit key
+def _key():
+    return _random.getrandbits(64)
+
+# Piece labels that can be on the board, the promoted labels of every kind included
+LABELS = [prefix + letter for letter in 'dsrgnp' for prefix in ('', '+')]
+LABELS += [label.upper() for label in LABELS]
+# PIECE_KEYS: Piece label to the key of it on every square
+# HAND_KEYS: Hand, LOWER or UPPER, to piece letter to the key of holding count pieces, count 0 is 0
+# SIDE_KEY: XORed in when UPPER is to move
+PIECE_KEYS = {label: [_key() for _ in range(NUM_SQUARES)] for label in LABELS}
+HAND_KEYS = [{label: [0] + [_key() for _ in range(MAX_HAND)] for label in LABELS if label[0] != '+'} for _ in range(2)]
+SIDE_KEY = _key()
+
+# Key of the pieces on a list of squares like BitBoard.squares
+def squares_key(squares):
+    key = 0
+    for sq, piece in enumerate(squares):
+        if piece in PIECE_KEYS:
+            key ^= PIECE_KEYS[piece][sq]
+    return key
+# Key of a capture hand like Board.upper_cap, side is the hand's owner
+def hand_key(side, hand):
+    keys = HAND_KEYS[side]
+    key = 0
+    for piece in set(hand):
+        key ^= keys[piece][hand.count(piece)]
+    return key
+# Change of a hand key when its count of piece goes from count to count + 1, or back
+def hand_step(side, piece, count):
+    keys = HAND_KEYS[side][piece]
+    return keys[count] ^ keys[count + 1]